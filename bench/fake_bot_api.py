@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Пользователь-бот, которого возвращает getMe
+BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'Flowers', 'username': 'flowers_loadtest_bot'}
+
+# Методы, которыми бот отвечает пользователю: такой ответ завершает действие пользователя
+REPLY_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'}
+
+
+class FakeBotApi:
+    """Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+    Бот подключается к серверу через ApplicationBuilder.base_url(api.base_url) и
+    получает обновления длинным опросом getUpdates, как от настоящего Telegram.
+    Имитатор пользователей отправляет команды и нажатия (send_command, click) и
+    ждет ответа бота в тот же чат (sendMessage, sendPhoto, edit*). У каждого
+    пользователя одновременно ожидается не больше одного ответа.
+
+    latency - искусственная задержка каждого запроса к API, сек (сетевые задержки Telegram).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        self.unexpected_replies = 0
+
+        self._runner = None
+        self._updates = None
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        # chat_id -> future, которое получит следующий ответ бота в этот чат
+        self._waiters = {}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._updates = asyncio.Queue()
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --- Сторона пользователя ---
+
+    @staticmethod
+    def user(user_id: int):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}", 'username': f"user{user_id}"}
+
+    async def send_command(self, user_id: int, text: str, timeout: float = 30):
+        """Отправляет боту текстовое сообщение (например, '/start') и ждет ответа."""
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self.user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return await self._push(user_id, {'message': message}, timeout)
+
+    async def click(self, user_id: int, message: dict, callback_data: str, timeout: float = 30):
+        """Нажимает inline-кнопку под сообщением бота и ждет ответа."""
+        callback_query = {
+            'id': str(next(self._callback_ids)),
+            'from': self.user(user_id),
+            'chat_instance': str(user_id),
+            'message': message,
+            'data': callback_data,
+        }
+        return await self._push(user_id, {'callback_query': callback_query}, timeout)
+
+    async def _push(self, chat_id, update, timeout):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        update['update_id'] = next(self._update_ids)
+        await self._updates.put(update)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self._waiters.get(chat_id) is future:
+                del self._waiters[chat_id]
+
+    # --- Сторона бота ---
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = getattr(self, f"_api_{method}", None)
+        result = await handler(params) if handler is not None else True
+
+        if method in REPLY_METHODS:
+            future = self._waiters.pop(int(params['chat_id']), None)
+            if future is not None and not future.done():
+                future.set_result(result)
+            else:
+                self.unexpected_replies += 1
+        return web.json_response({'ok': True, 'result': result})
+
+    def _message(self, params, **fields):
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': int(params['chat_id']), 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        message.update(fields)
+        return message
+
+    async def _api_getMe(self, params):
+        return BOT_USER
+
+    async def _api_getUpdates(self, params):
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        try:
+            updates = [await asyncio.wait_for(self._updates.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while len(updates) < limit and not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    async def _api_sendMessage(self, params):
+        return self._message(params, text=params.get('text', ''))
+
+    async def _api_sendPhoto(self, params):
+        file_id = f"photo{next(self._file_ids)}"
+        photo = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 800, 'height': 800}]
+        return self._message(params, photo=photo, caption=params.get('caption', ''))
+
+    async def _api_editMessageText(self, params):
+        return self._message(params, text=params.get('text', ''))
+
+    async def _api_editMessageReplyMarkup(self, params):
+        return self._message(params)
@@ -0,0 +1,79 @@
+import random
+
+# Класс карточки товара, как на странице каталога сайта (см. parser.PRODUCT_CARD_CLASS)
+CARD_CLASS = 'col-12 col-sm-6 col-md-6 col-lg-4 col-xl-3 g-mb-35 g-card in-stock'
+
+# Слова для названий букетов
+FLOWERS = ['Розы', 'Тюльпаны', 'Хризантемы', 'Пионы', 'Лилии', 'Гортензии', 'Ромашки', 'Эустомы']
+STYLES = ['нежный', 'яркий', 'классический', 'весенний', 'свадебный', 'авторский']
+
+# Схема таблиц, которые в рабочей БД созданы вручную (остальное добавляют миграции)
+BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id serial PRIMARY KEY,
+        telegram_user_id bigint NOT NULL,
+        username text
+    );
+    CREATE TABLE IF NOT EXISTS products (
+        id serial PRIMARY KEY,
+        name text,
+        link text,
+        price text,
+        image text
+    );
+    CREATE TABLE IF NOT EXISTS cart (
+        id serial PRIMARY KEY,
+        telegram_user_id bigint NOT NULL,
+        product_id integer REFERENCES products (id),
+        quantity integer NOT NULL DEFAULT 1
+    );
+"""
+
+
+def make_products(count: int, seed: int = 0):
+    """Детерминированно генерирует товары в том виде, в каком их возвращает парсер."""
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        price = rng.randrange(900, 25000, 50)
+        products.append({
+            'name': f"{rng.choice(FLOWERS)} {rng.choice(STYLES)} №{i}",
+            'link': f"/catalog/bukety/buket-{i}/",
+            # Примерно у трети товаров цена "от", разряды разделены пробелом, как на сайте
+            'price': f"{'от ' if rng.random() < 0.3 else ''}{price:,} ₽".replace(',', ' '),
+            'image': f"/upload/iblock/{i % 4096:03x}/buket-{i}.jpg",
+        })
+    return products
+
+
+def render_card(product):
+    """HTML одной карточки товара."""
+    return f"""
+<div class="{CARD_CLASS}">
+  <div class="g-card-inner">
+    <a href="{product['link']}" class="g-card-link">
+      <div class="product" style="background-image: url({product['image']})"></div>
+    </a>
+    <div class="g-card-body">
+      <div class="h3">{product['name']}</div>
+      <div class="rating"><span class="star"></span><span class="star"></span></div>
+      <div class="price g-div">{product['price']}</div>
+      <button class="btn btn-primary" type="button">В корзину</button>
+    </div>
+  </div>
+</div>"""
+
+
+def render_page(products):
+    """HTML страницы каталога: шапка, меню, карточки товаров и подвал."""
+    menu = ''.join(f'<li><a href="/catalog/{i}/">Раздел {i}</a></li>' for i in range(40))
+    cards = ''.join(render_card(product) for product in products)
+    return f"""<!DOCTYPE html>
+<html lang="ru">
+<head><meta charset="utf-8"><title>Букеты</title></head>
+<body>
+<header><nav><ul class="menu">{menu}</ul></nav></header>
+<main><div class="row catalog">{cards}</div></main>
+<footer><ul class="menu">{menu}</ul><p>Доставка цветов</p></footer>
+</body>
+</html>"""
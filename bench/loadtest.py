@@ -0,0 +1,320 @@
+"""Нагрузочное тестирование бота без обращения к Telegram.
+
+Бот (Application из bot/bot.py) работает как обычно, но Bot API заменен локальным
+сервером (fake_bot_api.py). Имитатор запускает заданное число пользователей,
+каждый проходит типичный сценарий: /start, просмотр и листание каталога,
+сортировка по цене, карточки товаров, добавление в корзину и просмотр корзины.
+Кнопки выбираются из клавиатур, которые прислал бот.
+
+Сервер API и пользователи работают в отдельном потоке со своим циклом событий,
+поэтому задержка цикла событий бота измеряется без их влияния (но процессорное
+время они делят с ботом через GIL, поэтому предельную пропускную способность
+лучше оценивать с запасом).
+
+Запуск:
+    python bench/loadtest.py --users 200
+    python bench/loadtest.py --users 500 --api-latency 0.05 --concurrent-updates 0
+
+БД: отдельная база (по умолчанию flowers_bench), заполняется сгенерированными товарами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from run_bench import percentile, prepare_database, reset_products, quiet
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+
+DEFAULT_USERS = 100
+DEFAULT_PRODUCTS = 1000
+# Средняя пауза пользователя между действиями, сек
+DEFAULT_THINK_TIME = 0.2
+# Сколько обновлений бот обрабатывает одновременно (0 - последовательно, как по умолчанию в python-telegram-bot)
+DEFAULT_CONCURRENT_UPDATES = 64
+# Сколько ждать ответа бота на одно действие, сек
+ACTION_TIMEOUT = 30
+# Период проверки задержки цикла событий бота, сек
+LAG_INTERVAL = 0.01
+# Идентификаторы имитируемых пользователей начинаются с этого числа
+FIRST_USER_ID = 10_000_000
+
+
+class LoopLagMonitor:
+    """Измеряет, насколько позже запланированного просыпается задача в цикле событий."""
+
+    def __init__(self, interval=LAG_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def find_button(message, predicate):
+    """Возвращает callback_data первой кнопки сообщения, для которой predicate(callback_data) истинно."""
+    keyboard = (message or {}).get('reply_markup', {}).get('inline_keyboard', [])
+    for row in keyboard:
+        for button in row:
+            data = button.get('callback_data')
+            if data is not None and predicate(data):
+                return data
+    return None
+
+
+def product_buttons(message):
+    keyboard = (message or {}).get('reply_markup', {}).get('inline_keyboard', [])
+    return [button['callback_data'] for row in keyboard for button in row
+            if button.get('callback_data', '').startswith('v1:product:')]
+
+
+class SessionAborted(Exception):
+    """Бот не ответил или прислал клавиатуру без нужной кнопки."""
+
+
+class UserSession:
+    """Один имитируемый пользователь, проходящий сценарий покупки."""
+
+    def __init__(self, api, user_id, rng, think_time, record):
+        self.api = api
+        self.user_id = user_id
+        self.rng = rng
+        self.think_time = think_time
+        self.record = record
+
+    async def _step(self, action, coroutine):
+        started = time.perf_counter()
+        try:
+            reply = await coroutine
+        except asyncio.TimeoutError:
+            self.record(action, time.perf_counter() - started, False)
+            raise SessionAborted(f"нет ответа на {action}") from None
+        self.record(action, time.perf_counter() - started, True)
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+        return reply
+
+    async def command(self, action, text):
+        return await self._step(action, self.api.send_command(self.user_id, text, ACTION_TIMEOUT))
+
+    async def click(self, action, message, callback_data):
+        if callback_data is None:
+            raise SessionAborted(f"нет кнопки для {action}")
+        return await self._step(action, self.api.click(self.user_id, message, callback_data, ACTION_TIMEOUT))
+
+    async def add_random_product(self, listing):
+        products = product_buttons(listing)
+        if not products:
+            raise SessionAborted("в списке нет товаров")
+        card = await self.click('product', listing, self.rng.choice(products))
+        await self.click('add_to_cart', card, find_button(card, lambda data: data.startswith('v1:add_to_cart:')))
+
+    async def run(self):
+        menu = await self.command('start', '/start')
+
+        listing = await self.click('show_products', menu, 'show_products')
+        next_page = find_button(listing, lambda data: data.startswith('v1:catalog:') and ':>:' in data)
+        if next_page is not None:
+            listing = await self.click('page', listing, next_page)
+        await self.add_random_product(listing)
+
+        menu = await self.click('main_menu', listing, 'main_menu')
+        options = await self.click('sort_products_price', menu, 'sort_products_price')
+        listing = await self.click('sort_price_asc', options, 'sort_price_asc')
+        await self.add_random_product(listing)
+
+        menu = await self.click('main_menu', listing, 'main_menu')
+        await self.click('show_cart', menu, 'show_cart')
+
+
+async def run_traffic(api, users, think_time, seed):
+    """Запускает сессии всех пользователей одновременно; возвращает замеры и время работы."""
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    aborted = []
+
+    def record(action, latency, ok):
+        if ok:
+            samples[action].append(latency)
+        else:
+            errors[action] += 1
+
+    async def session(i):
+        user = UserSession(api, FIRST_USER_ID + i, random.Random(seed + i), think_time, record)
+        try:
+            await user.run()
+        except SessionAborted as e:
+            aborted.append(str(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(users)))
+    return samples, errors, aborted, time.perf_counter() - started
+
+
+class ApiThread:
+    """Фоновый поток с собственным циклом событий для сервера API и пользователей."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-bot-api', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, coroutine):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def run_load_test(bot_module, application, api, api_thread, args):
+    async with application:
+        await bot_module.on_startup(application)
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+        await application.start()
+
+        lag = LoopLagMonitor()
+        lag.start()
+        try:
+            result = await api_thread.submit(run_traffic(api, args.users, args.think_time, args.seed))
+        finally:
+            await lag.stop()
+            await application.updater.stop()
+            await application.stop()
+            await bot_module.on_shutdown(application)
+    return result, lag.samples
+
+
+def build_report(samples, errors, aborted, duration, lag_samples, api, args):
+    all_latencies = [latency for latencies in samples.values() for latency in latencies]
+    actions = {}
+    for action in sorted(set(samples) | set(errors)):
+        latencies = samples.get(action, [])
+        actions[action] = {
+            'count': len(latencies),
+            'errors': errors.get(action, 0),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies, default=0.0),
+        }
+    return {
+        'users': args.users,
+        'products': args.products,
+        'think_time': args.think_time,
+        'api_latency': args.api_latency,
+        'concurrent_updates': args.concurrent_updates,
+        'duration': duration,
+        'actions_total': len(all_latencies),
+        'errors_total': sum(errors.values()),
+        'sessions_aborted': len(aborted),
+        'throughput': len(all_latencies) / duration if duration else 0.0,
+        'latency_p50': percentile(all_latencies, 0.5),
+        'latency_p99': percentile(all_latencies, 0.99),
+        'latency_mean': statistics.fmean(all_latencies) if all_latencies else 0.0,
+        'loop_lag_p50': percentile(lag_samples, 0.5),
+        'loop_lag_p99': percentile(lag_samples, 0.99),
+        'loop_lag_max': max(lag_samples, default=0.0),
+        'api_calls': dict(api.calls),
+        'unexpected_replies': api.unexpected_replies,
+        'actions': actions,
+    }
+
+
+def print_report(report):
+    print(f"\nПользователей: {report['users']}, товаров: {report['products']}, "
+          f"одновременных обновлений: {report['concurrent_updates'] or 'последовательно'}")
+    print(f"Действий: {report['actions_total']} за {report['duration']:.1f} с "
+          f"({report['throughput']:.1f} в секунду), ошибок: {report['errors_total']}, "
+          f"прерванных сессий: {report['sessions_aborted']}")
+    print(f"Задержка ответа: p50 {report['latency_p50'] * 1000:.1f} мс, p99 {report['latency_p99'] * 1000:.1f} мс")
+    print(f"Задержка цикла событий бота: p50 {report['loop_lag_p50'] * 1000:.1f} мс, "
+          f"p99 {report['loop_lag_p99'] * 1000:.1f} мс, максимум {report['loop_lag_max'] * 1000:.1f} мс\n")
+    for action, stats in report['actions'].items():
+        print(f"{action:<22} {stats['count']:>6}  p50 {stats['p50'] * 1000:8.1f} мс  "
+              f"p99 {stats['p99'] * 1000:8.1f} мс  ошибок {stats['errors']}")
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description="Нагрузочное тестирование бота с локальным Bot API")
+    args_parser.add_argument('--users', type=int, default=DEFAULT_USERS, help="количество пользователей")
+    args_parser.add_argument('--products', type=int, default=DEFAULT_PRODUCTS, help="количество товаров в каталоге")
+    args_parser.add_argument('--think-time', type=float, default=DEFAULT_THINK_TIME,
+                             help="средняя пауза между действиями пользователя, сек")
+    args_parser.add_argument('--api-latency', type=float, default=0.0,
+                             help="задержка каждого запроса к Bot API, сек")
+    args_parser.add_argument('--concurrent-updates', type=int, default=DEFAULT_CONCURRENT_UPDATES,
+                             help="сколько обновлений бот обрабатывает одновременно (0 - последовательно)")
+    args_parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора случайных чисел")
+    args_parser.add_argument('--db-name', default='flowers_bench', help="база данных для теста")
+    args_parser.add_argument('--output', help="файл для результатов (JSON)")
+    args = args_parser.parse_args()
+
+    # Модули читают параметры БД при импорте, поэтому имя базы задается заранее
+    os.environ['DB_NAME'] = args.db_name
+    sys.path.append(ROOT_DIR)
+    import config
+    # Каталог теста берется из тестовой базы, а не из снимка рабочего каталога
+    config.CATALOG_SNAPSHOT = None
+    import fixtures
+    from db.dbconnect import DB_CONFIG
+    from parser import parser as catalog_parser
+    from bot import bot as bot_module
+    from telegram.ext import Application
+    from fake_bot_api import FakeBotApi
+
+    # Каталог для теста: сгенерированные товары в отдельной базе
+    prepare_database(DB_CONFIG)
+    reset_products(DB_CONFIG)
+    with quiet():
+        catalog_parser.load_products_bulk(fixtures.make_products(args.products))
+
+    api = FakeBotApi(latency=args.api_latency)
+    api_thread = ApiThread()
+    api_thread.start()
+    asyncio.run_coroutine_threadsafe(api.start(), api_thread.loop).result()
+
+    builder = Application.builder().token('0:LOADTEST').base_url(api.base_url)
+    application = bot_module.build_application(builder, concurrent_updates=args.concurrent_updates)
+
+    try:
+        (samples, errors, aborted, duration), lag_samples = asyncio.run(
+            run_load_test(bot_module, application, api, api_thread, args)
+        )
+    finally:
+        asyncio.run_coroutine_threadsafe(api.stop(), api_thread.loop).result()
+        api_thread.stop()
+
+    report = build_report(samples, errors, aborted, duration, lag_samples, api, args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Набор бенчмарков для парсера и бота.
+
+Работает без сети: страницы каталога и товары генерируются (см. fixtures.py).
+Бенчмарки с БД используют отдельную базу (по умолчанию flowers_bench на сервере
+из db/dbconnect.py), которая создается автоматически; рабочая база не затрагивается.
+
+Запуск:
+    python bench/run_bench.py                      # все бенчмарки, размеры 100/1000/10000
+    python bench/run_bench.py --sizes 100 1000 --no-db
+    python bench/run_bench.py --compare bench/baseline.json
+
+Результаты сохраняются в JSON (--output) и могут сравниваться с предыдущим запуском (--compare).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+
+# База данных для бенчмарков; задается до импорта модулей, читающих DB_CONFIG
+BENCH_DB_NAME = 'flowers_bench'
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_REPEAT = 3
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results.json')
+# Количество одновременных нажатий на кнопки в бенчмарке button_burst
+BURST_CALLS = 1000
+# Доля товаров, у которых меняется цена, в бенчмарке инкрементальной загрузки
+CHANGED_SHARE = 0.1
+
+
+def summarize(name, size, timings, **extra):
+    """Сводка по замерам одного бенчмарка (время в секундах)."""
+    result = {
+        'benchmark': name,
+        'size': size,
+        'repeat': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'max': max(timings),
+    }
+    result.update(extra)
+    print(f"{name:<28} {size:>6}  median {result['median'] * 1000:10.2f} мс  min {result['min'] * 1000:10.2f} мс")
+    return result
+
+
+def measure(func, repeat, setup=None):
+    """Выполняет func repeat раз и возвращает время каждого выполнения; setup не измеряется."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+@contextlib.contextmanager
+def quiet():
+    """Скрывает вывод print из парсера во время замеров."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_parser(catalog_parser, fixtures, sizes, repeat):
+    results = []
+    for size in sizes:
+        page_html = fixtures.render_page(fixtures.make_products(size))
+        parsed = catalog_parser.parse_product_data(page_html)
+        assert len(parsed) == size, f"Распознано {len(parsed)} карточек из {size}"
+
+        results.append(summarize(
+            'parse_product_data', size,
+            measure(lambda: catalog_parser.parse_product_data(page_html), repeat),
+            html_bytes=len(page_html.encode('utf-8'))
+        ))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'products.csv')
+            results.append(summarize(
+                'save_to_csv', size,
+                measure(lambda: catalog_parser.save_to_csv(parsed, filename), repeat)
+            ))
+    return results
+
+
+def prepare_database(db_config):
+    """Создает базу для бенчмарков (если ее нет), базовые таблицы и применяет миграции."""
+    import psycopg2
+    from psycopg2 import sql
+    from db.migrations import apply_migrations
+    from fixtures import BASE_SCHEMA
+
+    admin = psycopg2.connect(**dict(db_config, dbname='postgres'))
+    try:
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_config['dbname'],))
+            if cursor.fetchone() is None:
+                cursor.execute(
+                    sql.SQL("CREATE DATABASE {} ENCODING 'UTF8' TEMPLATE template0")
+                    .format(sql.Identifier(db_config['dbname']))
+                )
+    finally:
+        admin.close()
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(BASE_SCHEMA)
+            apply_migrations(cursor)
+    finally:
+        conn.close()
+
+
+def reset_products(db_config):
+    """Очищает таблицы товаров, чтобы загрузка шла в пустую БД."""
+    import psycopg2
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("TRUNCATE cart, telegram_file_cache, products RESTART IDENTITY")
+    finally:
+        conn.close()
+
+
+def bench_database(catalog_parser, fixtures, sizes, repeat, db_config):
+    results = []
+    prepare_database(db_config)
+
+    def reset():
+        reset_products(db_config)
+
+    for size in sizes:
+        products = fixtures.make_products(size)
+        changed = [
+            dict(product, price=f"{product['price']} (акция)") if i % int(1 / CHANGED_SHARE) == 0 else product
+            for i, product in enumerate(products)
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp, quiet():
+            filename = os.path.join(tmp, 'products.csv')
+            catalog_parser.save_to_csv(products, filename)
+            # Построчная загрузка из CSV в пустую таблицу
+            legacy = measure(lambda: catalog_parser.load_data_to_db(filename), repeat, setup=reset)
+
+            # COPY в пустую таблицу
+            bulk_cold = measure(lambda: catalog_parser.load_products_bulk(products), repeat, setup=reset)
+
+            # Повторная загрузка тех же товаров: изменений нет
+            catalog_parser.load_products_bulk(products)
+            bulk_unchanged = measure(lambda: catalog_parser.load_products_bulk(products), repeat)
+
+            # Изменилась часть цен
+            bulk_changed = measure(
+                lambda: catalog_parser.load_products_bulk(changed), repeat,
+                setup=lambda: catalog_parser.load_products_bulk(products)
+            )
+
+        results.append(summarize('load_data_to_db', size, legacy))
+        results.append(summarize('load_products_bulk_cold', size, bulk_cold))
+        results.append(summarize('load_products_bulk_unchanged', size, bulk_unchanged))
+        results.append(summarize('load_products_bulk_changed', size, bulk_changed, changed_share=CHANGED_SHARE))
+
+    reset()
+    return results
+
+
+def make_catalog_df(fixtures, catalog_parser, size):
+    """DataFrame товаров в том виде, в каком бот загружает его из БД."""
+    import pandas as pd
+
+    rows = []
+    for product_id, product in enumerate(fixtures.make_products(size), start=1):
+        price_value, price_from = catalog_parser.normalize_price(product['price'])
+        rows.append(dict(product, id=product_id, price_value=price_value, price_from=price_from))
+    return pd.DataFrame(rows)
+
+
+def bench_catalog(bot_module, catalog_parser, fixtures, sizes, repeat):
+    from catalog import Catalog, ORDERS
+
+    results = []
+    for size in sizes:
+        df = make_catalog_df(fixtures, catalog_parser, size)
+        results.append(summarize('catalog_build', size, measure(lambda: Catalog(df), repeat)))
+
+        catalog = Catalog(df)
+        pages = catalog.page_count(bot_module.ITEMS_PER_PAGE)
+
+        def paginate():
+            for order in ORDERS:
+                for page in range(pages):
+                    catalog.page(order, page, bot_module.ITEMS_PER_PAGE)
+
+        results.append(summarize(
+            'catalog_paginate_all_orders', size, measure(paginate, repeat),
+            pages=pages * len(ORDERS)
+        ))
+
+        prices = df['price'].tolist()
+        results.append(summarize(
+            'extract_price', size,
+            measure(lambda: [bot_module.extract_price(price) for price in prices], repeat)
+        ))
+    return results
+
+
+class FakeMessage:
+    """Сообщение, у которого ответы ничего не отправляют, но уступают цикл событий, как сетевой вызов."""
+
+    text = ''
+
+    async def reply_text(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return self
+
+    async def reply_photo(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return SimpleNamespace(photo=[])
+
+    async def edit_text(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, user_id):
+        self.data = data
+        self.message = FakeMessage()
+        self.from_user = SimpleNamespace(id=user_id, username=None)
+
+    async def answer(self, *args, **kwargs):
+        await asyncio.sleep(0)
+
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        await asyncio.sleep(0)
+
+
+def fake_update(data, user_id):
+    query = FakeCallbackQuery(data, user_id)
+    return SimpleNamespace(callback_query=query, effective_message=query.message, message=None)
+
+
+def burst_callbacks(bot_module, calls):
+    """Набор нажатий, похожий на просмотр каталога: списки, листание, сортировки и карточки товаров.
+
+    Действия с корзиной не используются: они обращаются к БД через кэш корзин.
+    """
+    router = bot_module.router
+    product_ids = list(bot_module.catalog.by_id)
+    pages = bot_module.catalog.page_count(bot_module.ITEMS_PER_PAGE)
+    actions = [
+        lambda i: 'show_products',
+        lambda i: router.encode('page', 'd', i % pages),
+        lambda i: router.encode('page', 'pa', i % pages),
+        lambda i: 'sort_asc',
+        lambda i: 'sort_price_desc',
+        lambda i: router.encode('product', product_ids[i % len(product_ids)]),
+        lambda i: 'main_menu',
+    ]
+    return [actions[i % len(actions)](i) for i in range(calls)]
+
+
+async def run_burst(bot_module, callbacks):
+    latencies = []
+    context = SimpleNamespace(user_data={}, args=[])
+
+    async def press(i, data):
+        started = time.perf_counter()
+        await bot_module.button(fake_update(data, user_id=i % 100), context)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(press(i, data) for i, data in enumerate(callbacks)))
+    return time.perf_counter() - started, latencies
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def bench_button_burst(bot_module, catalog_parser, fixtures, sizes, repeat):
+    from catalog import Catalog
+
+    results = []
+    for size in sizes:
+        bot_module.catalog = Catalog(make_catalog_df(fixtures, catalog_parser, size))
+        callbacks = burst_callbacks(bot_module, BURST_CALLS)
+
+        timings, latencies = [], []
+        for _ in range(repeat):
+            total, call_latencies = asyncio.run(run_burst(bot_module, callbacks))
+            timings.append(total)
+            latencies.extend(call_latencies)
+
+        results.append(summarize(
+            'button_burst', size, timings,
+            calls=BURST_CALLS,
+            calls_per_second=BURST_CALLS / statistics.median(timings),
+            latency_p50=percentile(latencies, 0.5),
+            latency_p99=percentile(latencies, 0.99),
+        ))
+    return results
+
+
+def compare(results, baseline_path):
+    """Печатает изменение медианы относительно предыдущего запуска."""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(r['benchmark'], r['size']): r for r in json.load(file)['results']}
+
+    print(f"\nСравнение с {baseline_path}:")
+    for result in results:
+        old = baseline.get((result['benchmark'], result['size']))
+        if old is None or not old['median']:
+            continue
+        change = (result['median'] - old['median']) / old['median'] * 100
+        print(f"{result['benchmark']:<28} {result['size']:>6}  {change:+7.1f}%")
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description="Бенчмарки парсера и бота")
+    args_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                             help="количество карточек товаров")
+    args_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="количество повторов")
+    args_parser.add_argument('--output', default=DEFAULT_OUTPUT, help="файл для результатов (JSON)")
+    args_parser.add_argument('--compare', help="файл с результатами предыдущего запуска")
+    args_parser.add_argument('--no-db', action='store_true', help="пропустить бенчмарки с PostgreSQL")
+    args_parser.add_argument('--db-name', default=BENCH_DB_NAME, help="база данных для бенчмарков")
+    args = args_parser.parse_args()
+
+    # Модули читают параметры БД при импорте, поэтому имя базы задается заранее
+    os.environ['DB_NAME'] = args.db_name
+    sys.path.append(ROOT_DIR)
+    import fixtures
+    from db.dbconnect import DB_CONFIG
+    from parser import parser as catalog_parser
+    from bot import bot as bot_module
+
+    results = []
+    results += bench_parser(catalog_parser, fixtures, args.sizes, args.repeat)
+    if not args.no_db:
+        results += bench_database(catalog_parser, fixtures, args.sizes, args.repeat, DB_CONFIG)
+    results += bench_catalog(bot_module, catalog_parser, fixtures, args.sizes, args.repeat)
+    results += bench_button_burst(bot_module, catalog_parser, fixtures, args.sizes, args.repeat)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': args.sizes,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,165 @@
 import logging
-import subprocess
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
+import asyncio
+import hashlib
+import hmac
+import json
+import math
 import re
+import time
+import uuid
+from functools import partial
 
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
+import metrics
+from image_store import default_store
+from catalog_snapshot import fetch_catalog, read_snapshot, snapshot_path, SnapshotError
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../db')))  # Добавляем путь к db
-from db.dbconnect import DB_CONFIG
+from db.pool import get_connection, run_db, close_pool
+from db.migrations import ensure_migrations
+from db.catalog_events import CATALOG_CHANNEL, CART_CHANNEL, notify_cart_changed, claim_catalog_refresh
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))  # Добавляем путь к модулям бота
+from catalog import Catalog, ORDER_CODES, CODE_ORDERS
+from refresh import CatalogRefresher
+from photo_cache import PhotoCache
+from cart_cache import CartCache
+from user_registry import UserRegistry
+import search
+from router import CallbackRouter, MAX_CALLBACK_DATA, SEPARATOR
+from telegram_request import InstrumentedRequest
+from update_processor import PerUserUpdateProcessor
+from catalog_listener import CatalogListener
 # Настройка логирования
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
 # Константы
-PRODUCTS_CSV = 'parser/products.csv'
 BASE_URL = config.IMAGE_URL  # Базовый URL сайта
 ITEMS_PER_PAGE = 10  # Количество товаров на одной странице
 
-# Глобальная переменная для хранения корзин пользователей
-user_carts = {}
+# Кэш корзин: сколько пользователей держать в памяти, время жизни записи (сек),
+# период записи изменений в БД (сек) и количество изменений, при котором запись выполняется сразу
+CART_CACHE_MAX_USERS = 10000
+CART_CACHE_TTL = 300
+CART_FLUSH_INTERVAL = 2.0
+CART_MAX_PENDING = 500
+
+# Идентификатор этого экземпляра бота в уведомлениях об изменении корзин
+INSTANCE_ID = uuid.uuid4().hex
+
+# Количество соединений с Bot API (столько же по умолчанию использует python-telegram-bot)
+TELEGRAM_CONNECTION_POOL_SIZE = 256
+# Telegram открывает к webhook не больше 100 соединений одновременно
+WEBHOOK_MAX_CONNECTIONS = min(config.CONCURRENT_UPDATES, 100)
+
+# Маршрутизатор нажатий на кнопки (обработчики регистрируются в конце модуля);
+# время обработки каждой кнопки попадает в метрики
+router = CallbackRouter(observer=partial(metrics.record, 'callback'))
+
+# Строковые колонки товаров
+PRODUCT_TEXT_COLUMNS = ['name', 'link', 'price', 'image', 'image_hash']
+
+def products_frame(products):
+    """Преобразует строки товаров из БД (или колонки снимка каталога) в DataFrame
+    с абсолютными ссылками и путями к изображениям."""
+    products_df = pd.DataFrame(
+        products, columns=['id', 'name', 'link', 'price', 'image', 'price_value', 'price_from', 'image_hash']
+    )
+    # Пустые колонки pandas создает как float64, и к ним нельзя прибавить строку
+    products_df = products_df.astype({column: object for column in PRODUCT_TEXT_COLUMNS})
 
-def load_products():
-    """Загружает товары из базы данных PostgreSQL и преобразует относительные пути в абсолютные."""
-    try:
-        # Подключение к базе данных
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+    # Преобразуем относительные пути в абсолютные
+    products_df['link'] = BASE_URL + products_df['link']
+    products_df['image'] = BASE_URL + products_df['image']
+    return products_df
 
-        # Извлекаем данные о товарах из базы данных
-        cursor.execute("SELECT id, name, link, price, image FROM products")
-        products = cursor.fetchall()
+@metrics.timed('db')
+def load_products():
+    """Загружает товары из базы данных PostgreSQL.
 
-        # Закрытие соединения с базой данных
-        cursor.close()
-        conn.close()
+    Возвращает DataFrame товаров и версию каталога (время последнего изменения
+    товаров); при ошибке - пустой DataFrame и None.
+    """
+    try:
+        # Берем соединение из общего пула
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Схема БД должна быть актуальной до первого запроса к товарам
+            ensure_migrations(cursor)
 
-        # Преобразуем данные в DataFrame
-        products_df = pd.DataFrame(products, columns=['id', 'name', 'link', 'price', 'image'])
+            # Извлекаем данные о товарах из базы данных (тем же запросом парсер записывает снимок каталога)
+            products, version = fetch_catalog(cursor)
 
-        # Преобразуем относительные пути в абсолютные
-        products_df['link'] = BASE_URL + products_df['link']
-        products_df['image'] = BASE_URL + products_df['image']
-        return products_df
+        return products_frame(products), version
     except psycopg2.Error as e:
         logging.error(f"Ошибка загрузки данных из базы данных: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
 
-products_df = load_products()
+@metrics.timed('db')
+def load_changed_products(since):
+    """Загружает товары, изменившиеся после версии since (в том числе получившие
+    локальную копию изображения).
+
+    Возвращает DataFrame измененных и новых товаров, список id удаленных товаров
+    и новую версию каталога. Ошибки БД передаются вызывающему.
+    """
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id, p.name, p.link, p.price, p.image, p.price_value, p.price_from, f.sha256,
+                   p.deleted_at IS NOT NULL, GREATEST(p.updated_at, f.fetched_at)
+            FROM products p
+            LEFT JOIN image_files f ON f.image = p.image
+            WHERE p.updated_at > %s OR f.fetched_at > %s
+        """, (since, since))
+        rows = cursor.fetchall()
+
+    version = max((row[9] for row in rows), default=since)
+    deleted_ids = [row[0] for row in rows if row[8]]
+    changed_df = products_frame([row[:8] for row in rows if not row[8]])
+    return changed_df, deleted_ids, version
+
+def load_catalog():
+    """Загружает товары и строит каталог с заранее вычисленными ценами и порядками сортировки."""
+    products_df, version = load_products()
+    return Catalog(products_df, version=version)
+
+def load_snapshot_catalog():
+    """Строит каталог из снимка, записанного парсером (catalog_snapshot.py), без обращения к БД.
+
+    Возвращает None, если снимка нет или его не удалось прочитать.
+    """
+    path = snapshot_path()
+    if path is None:
+        return None
+    try:
+        columns, version = read_snapshot(path)
+        return Catalog(products_frame(columns), version=version)
+    except FileNotFoundError:
+        logging.info(f"Снимок каталога {path} не найден, каталог загружается из БД")
+        return None
+    except (SnapshotError, OSError) as e:
+        logging.warning(f"Не удалось прочитать снимок каталога: {e}")
+        return None
+    except Exception as e:
+        # Каталог из снимка не построен - бот загрузит его из БД
+        logging.error(f"Не удалось построить каталог из снимка {path}: {e}")
+        return None
+
+# Каталог загружается при запуске бота (on_startup), а не при импорте модуля,
+# поэтому модуль можно импортировать без работающей базы данных
+catalog = Catalog(pd.DataFrame())
+
+# Кэш file_id фотографий товаров, уже отправленных в Telegram (загружается вместе с каталогом)
+photo_cache = PhotoCache()
+
+# Локальные копии изображений, загруженные парсером (None - фото отправляются по URL сайта)
+image_store = default_store()
 
 def extract_price(price_str: str):
     """Извлекает числовую часть из строки цены (например, 'от 3500 ₽' -> 3500)."""
@@ -60,6 +170,42 @@ def extract_price(price_str: str):
         return float(price_str)
     return 0
 
+def read_local_image(image_hash):
+    """Читает локальную копию изображения (уменьшенную, если есть); None, если копии нет."""
+    if image_store is None or not isinstance(image_hash, str):
+        return None
+    path = image_store.path(image_hash)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except OSError as e:
+        logging.warning(f"Не удалось прочитать локальную копию изображения {path}: {e}")
+        return None
+
+async def send_product_photo(message, image_url: str, caption: str, reply_markup, image_hash=None):
+    """Отправляет фото товара: по сохраненному file_id, а при первой отправке - из локальной
+    копии (если парсер ее сохранил) или по URL, с запоминанием полученного file_id."""
+    file_id = photo_cache.get(image_url)
+    if file_id is not None:
+        try:
+            await message.reply_photo(photo=file_id, caption=caption, parse_mode="Markdown",
+                                      reply_markup=reply_markup)
+            return
+        except BadRequest as e:
+            # file_id мог устареть - отправляем фото заново
+            logging.warning(f"Telegram не принял сохраненный file_id для {image_url}: {e}")
+            await run_db(photo_cache.forget, image_url)
+
+    # Локальная копия не зависит от скорости сайта; файл читается вне цикла событий
+    photo = await asyncio.to_thread(read_local_image, image_hash)
+    sent = await message.reply_photo(photo=photo if photo is not None else image_url, caption=caption,
+                                     parse_mode="Markdown", reply_markup=reply_markup)
+    if sent.photo:
+        # Самый большой размер фото - последний в списке
+        await run_db(photo_cache.remember, image_url, sent.photo[-1].file_id)
+
 # Обработчик команды /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Приветственное сообщение с кнопками для навигации."""
@@ -68,8 +214,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_user_id = update.message.from_user.id
     username = update.message.from_user.username  # Имя пользователя (если оно есть)
 
-    # Добавляем пользователя в базу данных
-    add_user_to_db(telegram_user_id, username)
+    # Добавляем пользователя в базу данных, если его нет в кэше (новые записываются пакетами)
+    await user_registry.register(telegram_user_id, username)
 
     # Кнопки для взаимодействия
     keyboard = [
@@ -108,235 +254,310 @@ async def return_to_main_menu(update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Обработчик команды /products
-async def show_products(update: Update, context: ContextTypes.DEFAULT_TYPE, products_data: pd.DataFrame = None):
+async def show_products(update: Update, context: ContextTypes.DEFAULT_TYPE, order: str = 'default'):
     """Отображает список товаров с кнопками для просмотра."""
-    # Если products_data не передан, используем глобальный products_df
-    if products_data is None:
-        products_data = products_df
-
-    if products_data.empty:
-        await update.message.reply_text("Список товаров пуст.")
+    if catalog.empty:
+        await update.effective_message.reply_text("Список товаров пуст.")
         return
 
     # Показываем первую страницу товаров
-    await show_products_page(update, products_data, 0)
+    await show_products_page(update, order, 0)
 
 
 # Функция для отображения товаров на странице
-async def show_products_page(update: Update, products_data: pd.DataFrame, page: int):
-    """Отображает товары на странице с кнопками пагинации."""
-    start_index = page * ITEMS_PER_PAGE
-    end_index = (page + 1) * ITEMS_PER_PAGE
-    products_page = products_data.iloc[start_index:end_index]
+async def show_products_page(update: Update, order: str, page: int = 0, edit: bool = False, cursor=None):
+    """Отображает товары на странице с кнопками пагинации.
+
+    cursor - ключ листания из кнопки ("<" или ">", значение сортировки, id товара): страница
+    строится относительно товара на краю предыдущей, а не по номеру, поэтому после
+    обновления каталога товары не сдвигаются. Без cursor показывается страница page.
+    При edit=True (листание страниц) заменяются только кнопки в том же сообщении,
+    а не отправляется новое.
+    """
+    current = catalog
+    page_count = current.page_count(ITEMS_PER_PAGE)
+    if cursor is not None:
+        start, products_page = current.page_at(order, *cursor, ITEMS_PER_PAGE)
+    else:
+        start = min(max(page, 0), page_count - 1) * ITEMS_PER_PAGE
+        products_page = current.slice(order, start, ITEMS_PER_PAGE)
+    # Номер страницы только для подписи: после обновления каталога начало страницы может не совпадать с границей
+    page = -(-start // ITEMS_PER_PAGE)
 
-    # Генерация кнопок с товарами
+    # Генерация кнопок с товарами (в callback_data передаем id товара из БД)
     keyboard = [
-        [InlineKeyboardButton(product["name"], callback_data=f"product_{index}")]
-        for index, product in products_page.iterrows()
+        [InlineKeyboardButton(product["name"], callback_data=router.encode('product', product['id']))]
+        for product in products_page
     ]
 
-    # Добавляем кнопку "Показать еще" для следующей страницы
-    next_page_button = InlineKeyboardButton('Показать еще', callback_data=f"next_{page + 1}")
-    keyboard.append([next_page_button])
+    # Навигация: состояние просмотра (порядок сортировки и ключ листания) хранится в callback_data
+    navigation = []
+    if start > 0:
+        navigation.append(InlineKeyboardButton(
+            '« Назад', callback_data=catalog_callback(current, order, '<', products_page[0])))
+    navigation.append(InlineKeyboardButton(f"{min(page + 1, page_count)}/{page_count}", callback_data='noop'))
+    if products_page and start + len(products_page) < len(current):
+        navigation.append(InlineKeyboardButton(
+            'Вперед »', callback_data=catalog_callback(current, order, '>', products_page[-1])))
+    keyboard.append(navigation)
     keyboard.append([InlineKeyboardButton("Главное меню", callback_data='main_menu')])
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    # Отправляем новое сообщение с товарами (или редактируем старое, если сообщение уже существует)
-    if update.message:
-        await update.message.reply_text("Выберите товар:", reply_markup=reply_markup)
-    else:
-        await update.callback_query.message.reply_text("Выберите товар:", reply_markup=reply_markup)
+    if edit and update.callback_query:
+        try:
+            await update.callback_query.edit_message_reply_markup(reply_markup=reply_markup)
+        except BadRequest as e:
+            # Повторное нажатие на ту же кнопку: клавиатура уже такая же
+            if 'not modified' not in str(e):
+                raise
+        return
+
+    # Отправляем новое сообщение с товарами
+    await update.effective_message.reply_text("Выберите товар:", reply_markup=reply_markup)
 
 
 # Обработчик нажатий на кнопки
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает нажатия на кнопки и выполняет соответствующие действия."""
+    """Обрабатывает нажатия на кнопки: маршрутизатор выбирает обработчик по действию из callback_data."""
+    await router.dispatch(update, context)
+
+
+async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+    """Показывает карточку товара с кнопками корзины."""
     query = update.callback_query
-    await query.answer()
-
-    # Проверяем тип callback_data
-    callback_data = query.data
-
-    if callback_data == 'show_products':
-        # Если нажата кнопка "Посмотреть товары"
-        await show_products(update, context)
-    elif callback_data == 'show_cart':
-        # Если нажата кнопка "Показать корзину"
-        await show_cart(update, context)  # Отображаем корзину
-    elif callback_data == 'sort_products':
-        # Если нажата кнопка "Сортировать по алфавиту"
-        await show_sort_options(update, context)
-    elif callback_data == 'sort_products_price':
-        # Если нажата кнопка "Сортировать по цене"
-       await show_sort_options_price(update, context)
-    elif callback_data == 'help':
-        # Если нажата кнопка "Получить помощь"
-        await show_help(update, context)
-    elif callback_data == 'update_products':
-        # Если нажата кнопка "Обновить список товаров"
-        await update_products(update, context)
-    elif callback_data.startswith('product'):
-        # Если нажата кнопка с товаром
-        product_index = int(callback_data.split('_')[1])
-        product = products_df.iloc[product_index]
-
-        # Формируем сообщение о товаре
-        message = (
-            f"*{product['name']}*\n"
-            f"Цена: {product['price']}\n"
-            f"[Ссылка на товар]({product['link']})"
+    product = catalog.get(product_id)
+    if product is None:
+        await query.message.reply_text("Этот товар больше недоступен.")
+        return
+
+    # Формируем сообщение о товаре
+    message = (
+        f"*{product['name']}*\n"
+        f"Цена: {product['price']}\n"
+        f"[Ссылка на товар]({product['link']})"
+    )
+
+    keyboard = [
+        [InlineKeyboardButton("Добавить в корзину", callback_data=router.encode('add_to_cart', product_id))],
+        [InlineKeyboardButton("Убрать из корзины", callback_data=router.encode('remove_from_cart', product_id))],
+        [InlineKeyboardButton("Назад к товарам", callback_data='show_products')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if product.get('image', 'Без изображения') != 'Без изображения':
+        await send_product_photo(query.message, product['image'], message, reply_markup, product.get('image_hash'))
+    else:
+        await query.message.reply_text(
+            text=message,
+            parse_mode="Markdown",
+            reply_markup=reply_markup
         )
 
-        keyboard = [
-            [InlineKeyboardButton("Добавить в корзину", callback_data=f"add_to_cart_{product_index}")],
-            [InlineKeyboardButton("Назад к товарам", callback_data='show_products')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        if product.get('image', 'Без изображения') != 'Без изображения':
-            await query.message.reply_photo(
-                photo=product['image'],
-                caption=message,
-                parse_mode="Markdown",
-                reply_markup=reply_markup
-            )
-        else:
-            await query.message.reply_text(
-                text=message,
-                parse_mode="Markdown",
-                reply_markup=reply_markup
-            )
-
-    elif callback_data.startswith('next_'):
-        # Получаем номер следующей страницы из callback_data
-        next_page = int(callback_data.split('_')[1])
-
-        # Отображаем товары для следующей страницы
-        await show_products_page(update, products_df, next_page)
-
-
-    elif callback_data.startswith('main_menu'):
-        await return_to_main_menu(update, context)
-
-    elif callback_data == 'sort_asc':
-        # Сортировка по алфавиту (A-Z)
-        await sort_products(update, context, ascending=True)
-
-    elif callback_data == 'sort_desc':
-        # Сортировка по алфавиту (Z-A)
-        await sort_products(update, context, ascending=False)
-
-    elif callback_data == 'sort_price_asc':
-        # Сортировка по цене (от низкой к высокой)
-        await sort_products_price(update, context, by_price=True)
-
-    elif callback_data == 'sort_price_desc':
-        # Сортировка по цене (от высокой к низкой)
-        await sort_products_price(update, context, by_price=False)
-
-    elif callback_data.startswith('add_to_cart'):
-        # Получаем индекс товара из callback_data
-        match = re.match(r"add_to_cart_(\d+)", callback_data)
-        if match:
-            product_index = int(match.group(1))
-            # В данном месте вызов add_to_cart будет синхронным, так как сама функция не асинхронная
-            product = products_df.iloc[product_index]
-            user_id = update.callback_query.from_user.id  # Получаем ID пользователя
-            success = add_to_cart(user_id, product['id'], quantity=1)
-
-            if success:
-                await query.message.reply_text(f"Товар '{product['name']}' был добавлен в вашу корзину!")
-            else:
-                await query.message.reply_text(f"Произошла ошибка при добавлении товара '{product['name']}' в корзину.")
-        else:
-            logging.error(f"Ошибка извлечения индекса товара из callback_data: {callback_data}")
 
-    elif callback_data == 'clear_cart':
-        # Очистка корзины пользователя
-        user_id = update.callback_query.from_user.id  # Получаем ID пользователя
-        success = clear_cart(user_id)
+def catalog_callback(current, order: str, direction: str, product) -> str:
+    """callback_data кнопки листания каталога: страница после (">") или перед ("<") товаром.
 
-        if success:
-            await query.message.reply_text("Ваша корзина была успешно очищена!")
-        else:
-            await query.message.reply_text("Произошла ошибка при очистке корзины.")
+    Значение сортировки передается в кнопке, чтобы листание продолжилось с того же места,
+    даже если товара уже нет в каталоге. Название не всегда помещается в callback_data,
+    поэтому в кнопку попадает его начало (см. Catalog.page_at).
+    """
+    code = ORDER_CODES[order]
+    key = current.cursor_key(order, product).split(SEPARATOR)[0]
+    budget = MAX_CALLBACK_DATA - len(router.encode('catalog', code, direction, '', product['id']).encode('utf-8'))
+    key = key.encode('utf-8')[:budget].decode('utf-8', errors='ignore')
+    return router.encode('catalog', code, direction, key, product['id'])
 
-def add_to_cart(telegram_user_id: int, product_id: int, quantity: int = 1):
-    """Добавляет товар в корзину для конкретного пользователя. Если товар уже есть, увеличиваем количество."""
-    try:
-        # Преобразуем product_id и quantity в обычные типы int, если они являются numpy.int64
-        telegram_user_id = int(telegram_user_id)
-        product_id = int(product_id)
-        quantity = int(quantity)
-
-        # Подключение к базе данных
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        # Проверяем, существует ли пользователь в таблице users по telegram_user_id
-        cursor.execute("SELECT id FROM users WHERE telegram_user_id = %s", (telegram_user_id,))
-        user_record = cursor.fetchone()
-        if user_record is None:
-            logging.error(f"Пользователь с telegram_user_id {telegram_user_id} не найден в таблице users.")
-            return False  # Возвращаем False, если пользователь не найден
-
-        # Получаем id пользователя, чтобы использовать его в таблице cart
-        user_id = user_record[0]
-
-        # Проверяем, есть ли товар в корзине пользователя
-        cursor.execute("""
-            SELECT quantity FROM cart WHERE telegram_user_id = %s AND product_id = %s
-        """, (telegram_user_id, product_id))
-        existing_item = cursor.fetchone()
-
-        if existing_item:
-            # Если товар уже есть, увеличиваем количество
-            new_quantity = existing_item[0] + quantity
-            cursor.execute("""
-                UPDATE cart SET quantity = %s WHERE telegram_user_id = %s AND product_id = %s
-            """, (new_quantity, telegram_user_id, product_id))
-        else:
-            # Если товара нет, добавляем его с указанным количеством
-            cursor.execute("""
-                INSERT INTO cart (telegram_user_id, product_id, quantity) VALUES (%s, %s, %s)
-            """, (telegram_user_id, product_id, quantity))
 
-        # Сохраняем изменения и закрываем соединение
-        conn.commit()
-        cursor.close()
-        conn.close()
+async def turn_page(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str, page: int):
+    """Листает каталог по номеру страницы (кнопки из сообщений, отправленных до ключей листания)."""
+    await show_products_page(update, CODE_ORDERS.get(code, 'default'), page, edit=True)
 
-        return True
 
-    except psycopg2.Error as e:
-        logging.error(f"Ошибка при добавлении товара в корзину: {e}")
-        return False
+async def turn_catalog_page(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            code: str, direction: str, key: str, product_id: int):
+    """Листает каталог: код порядка сортировки и ключ листания приходят из кнопки."""
+    if direction not in ('<', '>'):
+        logging.warning(f"Неизвестное направление листания в callback_data: {direction}")
+        return
+    await show_products_page(update, CODE_ORDERS.get(code, 'default'), edit=True,
+                             cursor=(direction, key, product_id))
 
 
-def get_user_cart(telegram_user_id: int):
-    """Возвращает товары из корзины для конкретного пользователя."""
-    try:
-        # Подключение к базе данных
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+def parse_legacy_next(rest: str):
+    """Разбирает кнопки "Показать еще" ("next_{порядок}_{страница}") из сообщений,
+    отправленных до появления навигации."""
+    order, _, next_page = rest.rpartition('_')
+    return ORDER_CODES.get(order, ORDER_CODES['default']), next_page
 
-        # Получаем товары из корзины пользователя
-        cursor.execute("""
-            SELECT p.name, p.price, c.quantity 
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            WHERE c.telegram_user_id = %s
-        """, (telegram_user_id,))
-        cart_items = cursor.fetchall()
 
-        cursor.close()
-        conn.close()
+async def noop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка с номером страницы ничего не делает."""
 
-        return cart_items
 
-    except psycopg2.Error as e:
-        logging.error(f"Ошибка при получении корзины пользователя: {e}")
-        return []
+async def outdated_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки товаров старого формата ("product_{n}", "add_to_cart_{n}") не обрабатываются:
+    в разных версиях бота {n} был то позицией в списке, то id товара, и угадать товар нельзя."""
+    keyboard = [[InlineKeyboardButton("Посмотреть товары", callback_data='show_products')]]
+    await update.callback_query.message.reply_text(
+        "Эта кнопка устарела. Откройте список товаров заново.",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def next_name_search(update: Update, context: ContextTypes.DEFAULT_TYPE, after_id: int, text: str):
+    """Следующая страница поиска по названию (текст запроса приходит из кнопки)."""
+    await show_name_search(update, context, text, after_id)
+
+
+async def next_saved_name_search(update: Update, context: ContextTypes.DEFAULT_TYPE, after_id: int, key: str):
+    """Следующая страница поиска по названию для длинного запроса, сохраненного в БД по ключу."""
+    text = await run_db(search.load_query, key)
+    if text is None:
+        await search_expired(update, context)
+        return
+    await show_name_search(update, context, text, after_id)
+
+
+async def search_expired(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Показать еще" без текста запроса (из старых сообщений)."""
+    await update.callback_query.message.reply_text("Эти результаты поиска устарели. Повторите поиск: /search <текст>")
+
+
+async def next_price_search(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            min_price: float, max_price: float, after_price: float, after_id: int):
+    """Следующая страница поиска по цене после товара (after_price, after_id)."""
+    await show_price_search(update, context, min_price, max_price, (after_price, after_id))
+
+
+async def add_product_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+    """Добавляет товар в корзину пользователя."""
+    query = update.callback_query
+    product = catalog.get(product_id)
+    if product is None:
+        await query.message.reply_text("Этот товар больше недоступен.")
+        return
+    user_id = query.from_user.id  # Получаем ID пользователя
+    # Корзина записывается только для пользователей из таблицы users: если пользователь
+    # не нажимал /start, регистрируем его (для известных пользователей проверка идет по кэшу)
+    if not await user_registry.register(user_id, query.from_user.username):
+        # Без записи в users изменение корзины не сохранилось бы в БД
+        await query.message.reply_text("Произошла ошибка. Не удалось добавить товар в корзину, попробуйте позже.")
+        return
+    # Изменение попадает в кэш корзин и записывается в БД в фоне
+    await cart_cache.add(user_id, int(product['id']), quantity=1)
+    await query.message.reply_text(f"Товар '{product['name']}' был добавлен в вашу корзину!")
+
+
+async def remove_product_from_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+    """Уменьшает количество товара в корзине на единицу."""
+    query = update.callback_query
+    product = catalog.get(product_id)
+    name = product['name'] if product is not None else 'товар'
+    user_id = query.from_user.id  # Получаем ID пользователя
+    removed = await cart_cache.remove(user_id, product_id, quantity=1)
+
+    if removed:
+        await query.message.reply_text(f"Товар '{name}' убран из корзины (1 шт.).")
+    else:
+        await query.message.reply_text(f"Товара '{name}' нет в вашей корзине.")
+
+
+async def clear_user_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Очищает корзину пользователя."""
+    query = update.callback_query
+    user_id = query.from_user.id  # Получаем ID пользователя
+    cart_cache.clear(user_id)
+    await query.message.reply_text("Ваша корзина была успешно очищена!")
+
+
+def _upsert_cart_rows(cursor, rows):
+    """Увеличивает количество товаров в корзинах одним запросом (строки: пользователь, товар, количество).
+
+    Строки пользователей, которых нет в таблице users, не записываются;
+    возвращает список таких пропущенных пар (пользователь, товар).
+    """
+    # Повторы одной пары (пользователь, товар) суммируются заранее:
+    # ON CONFLICT не может изменить одну строку дважды в одном запросе
+    written = execute_values(cursor, """
+        INSERT INTO cart (telegram_user_id, product_id, quantity)
+        SELECT v.telegram_user_id, v.product_id, SUM(v.quantity)
+        FROM (VALUES %s) AS v (telegram_user_id, product_id, quantity)
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.telegram_user_id = v.telegram_user_id)
+        GROUP BY v.telegram_user_id, v.product_id
+        ON CONFLICT (telegram_user_id, product_id)
+        DO UPDATE SET quantity = cart.quantity + EXCLUDED.quantity
+        RETURNING telegram_user_id, product_id
+    """, rows, page_size=len(rows), fetch=True)
+    written = set(written)
+    return sorted({(user_id, product_id) for user_id, product_id, _ in rows} - written)
+
+
+@metrics.timed('db')
+def get_cart_quantities(telegram_user_id: int):
+    """Возвращает корзину пользователя в виде {product_id: quantity} (используется кэшем корзин)."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT product_id, quantity FROM cart WHERE telegram_user_id = %s AND quantity > 0",
+            (telegram_user_id,)
+        )
+        return dict(cursor.fetchall())
+
+
+@metrics.timed('db')
+def apply_cart_changes(clears, deltas):
+    """Записывает пакет изменений корзин одной транзакцией (используется кэшем корзин).
+
+    clears - пользователи, чьи корзины очищены; deltas - {(telegram_user_id, product_id): изменение количества}.
+    Другие экземпляры бота получают уведомление и сбрасывают эти корзины из своего кэша.
+    """
+    increments = [(user_id, product_id, delta) for (user_id, product_id), delta in deltas.items() if delta > 0]
+    decrements = [(user_id, product_id, -delta) for (user_id, product_id), delta in deltas.items() if delta < 0]
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        if clears:
+            cursor.execute("DELETE FROM cart WHERE telegram_user_id = ANY(%s)", (clears,))
+        if increments:
+            dropped = _upsert_cart_rows(cursor, increments)
+            if dropped:
+                # Пользователь регистрируется до изменения корзины (add_product_to_cart),
+                # так что сюда попадают только строки пользователей, удаленных из users
+                logging.warning(
+                    f"Не записано {len(dropped)} изменений корзин пользователей, которых нет в таблице users: "
+                    f"{sorted({user_id for user_id, _ in dropped})}"
+                )
+        if decrements:
+            execute_values(cursor, """
+                UPDATE cart SET quantity = cart.quantity - v.quantity
+                FROM (VALUES %s) AS v (telegram_user_id, product_id, quantity)
+                WHERE cart.telegram_user_id = v.telegram_user_id AND cart.product_id = v.product_id
+            """, decrements, page_size=len(decrements))
+            execute_values(cursor, """
+                DELETE FROM cart
+                USING (VALUES %s) AS v (telegram_user_id, product_id)
+                WHERE cart.telegram_user_id = v.telegram_user_id AND cart.product_id = v.product_id
+                  AND cart.quantity <= 0
+            """, [(user_id, product_id) for user_id, product_id, _ in decrements], page_size=len(decrements))
+        notify_cart_changed(cursor, INSTANCE_ID, set(clears) | {user_id for user_id, _ in deltas})
+
+
+def on_cart_notification(payload):
+    """Сбрасывает из кэша корзины, измененные другим экземпляром бота (payload=None - все корзины)."""
+    if payload is None:
+        # Подписка (пере)подключилась - уведомления за время разрыва могли быть пропущены
+        cart_cache.invalidate_all()
+        return
+    message = json.loads(payload)
+    if message['instance'] != INSTANCE_ID:
+        cart_cache.invalidate(message['users'])
+
+
+# Кэш корзин пользователей с отложенной записью в БД
+cart_cache = CartCache(
+    get_cart_quantities, apply_cart_changes,
+    max_users=CART_CACHE_MAX_USERS, ttl=CART_CACHE_TTL,
+    flush_interval=CART_FLUSH_INTERVAL, max_pending=CART_MAX_PENDING
+)
+
 
 # Функция для отображения корзины пользователя
 async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -345,8 +566,15 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Получаем ID пользователя
     telegram_user_id = update.callback_query.from_user.id
 
-    # Получаем товары из корзины пользователя
-    cart_items = get_user_cart(telegram_user_id)
+    # Получаем товары из корзины пользователя (из кэша, без запроса к БД)
+    quantities = await cart_cache.get(telegram_user_id)
+    cart_items = []
+    for product_id, quantity in quantities.items():
+        product = catalog.get(product_id)
+        if product is None:
+            cart_items.append(("Товар больше недоступен", '-', 0, quantity))
+        else:
+            cart_items.append((product['name'], product['price'], product['price_value'], quantity))
 
     if not cart_items:
         await update.callback_query.message.reply_text("Ваша корзина пуста.")
@@ -357,8 +585,9 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     total_price = 0  # Переменная для подсчета общей стоимости
 
     for item in cart_items:
-        name, price, quantity = item
-        item_total = extract_price(price) * quantity
+        name, price, price_value, quantity = item
+        # Цена уже хранится числом, разбирать строку не нужно
+        item_total = price_value * quantity
         total_price += item_total
         cart_message += f"{name} - {price} ₽ x {quantity} = {item_total} ₽\n"
 
@@ -379,40 +608,6 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.callback_query.message.reply_text(cart_message, parse_mode="Markdown", reply_markup=reply_markup)
 
-# Функция для очистки корзины пользователя
-def clear_cart(telegram_user_id: int):
-    """Очищает корзину пользователя."""
-    try:
-        # Подключение к базе данных
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        # Логирование запроса
-        logging.debug(f"SQL-запрос: DELETE FROM cart WHERE telegram_user_id = {telegram_user_id}")
-
-        # Удаляем все товары из корзины пользователя
-        cursor.execute("DELETE FROM cart WHERE telegram_user_id = %s", (telegram_user_id,))
-
-        # Проверяем количество затронутых строк
-        rows_deleted = cursor.rowcount
-        if rows_deleted == 0:
-            logging.warning(f"Не удалено ни одной записи для telegram_user_id {telegram_user_id}")
-        else:
-            logging.info(f"Удалено {rows_deleted} записей из корзины для пользователя {telegram_user_id}")
-
-        # Сохраняем изменения и закрываем соединение
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        logging.info(f"Корзина пользователя с telegram_user_id {telegram_user_id} была очищена.")
-        return True
-    except psycopg2.Error as e:
-        logging.error(f"Ошибка при очистке корзины: {e}")
-        # Дополнительная информация о ошибки
-        logging.error(f"Текст ошибки: {e.pgcode} - {e.pgerror}")
-        return False
-
 
 async def show_sort_options(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает две опции сортировки: A-Z и Z-A"""
@@ -437,77 +632,208 @@ async def show_sort_options_price(update: Update, context: ContextTypes.DEFAULT_
     await update.callback_query.message.reply_text("Выберите порядок сортировки:", reply_markup=reply_markup)
 
 async def sort_products(update: Update, context: ContextTypes.DEFAULT_TYPE, ascending: bool):
-    """Сортирует товары по алфавиту и отображает их."""
-    global products_df  # Это глобальная переменная для продуктов
-
-    if not products_df.empty:
-        # Создаем копию DataFrame для сортировки
-        sorted_products_df = products_df.copy()
-
-        # Сортируем копию по имени товара
-        sorted_products_df = sorted_products_df.sort_values(by='name', ascending=ascending)
-        # Сбрасываем индексы после сортировки
-        sorted_products_df = sorted_products_df.reset_index(drop=True)
-        # Показать товары после сортировки
-        await show_products(update, context, sorted_products_df)  # Передаем отсортированные данные
+    """Отображает товары, отсортированные по алфавиту (порядок вычислен заранее в каталоге)."""
+    if not catalog.empty:
+        await show_products(update, context, 'name_asc' if ascending else 'name_desc')
     else:
-        await update.message.reply_text("Нет товаров для сортировки.")
+        await update.effective_message.reply_text("Нет товаров для сортировки.")
 
 async def sort_products_price(update: Update, context: ContextTypes.DEFAULT_TYPE, by_price: bool):
-    """Сортирует товары по цене и отображает их."""
-    global products_df  # Это глобальная переменная для продуктов
+    """Отображает товары, отсортированные по цене (порядок вычислен заранее в каталоге)."""
+    if not catalog.empty:
+        await show_products(update, context, 'price_asc' if by_price else 'price_desc')
+    else:
+        await update.effective_message.reply_text("Нет товаров для сортировки.")
+
+def run_parser(progress):
+    """Запускает парсер в текущем процессе (вызывается в отдельном потоке)."""
+    # Парсер импортируется только при первом обновлении, чтобы не замедлять запуск бота
+    from parser import parser as catalog_parser
+    return catalog_parser.main(progress=progress)
+
+
+# Загрузки каталога выполняются по очереди, чтобы более старый каталог не подменил более новый
+catalog_lock = asyncio.Lock()
+
+
+async def reload_catalog():
+    """Загружает товары из БД и подменяет текущий каталог новым."""
+    global catalog
+    async with catalog_lock:
+        loaded = await run_db(load_catalog)
+        if loaded.version is None and catalog.version is not None:
+            # БД недоступна - продолжаем работать с каталогом из снимка, изменения
+            # догрузятся после восстановления соединения (см. catalog_listener)
+            logging.warning(f"Каталог не загружен из БД, используется прежний ({len(catalog)} товаров)")
+            return
+        catalog = loaded
+        # Парсер мог удалить file_id изменившихся изображений
+        await run_db(photo_cache.load)
+
+
+async def sync_catalog():
+    """Догружает из БД товары, изменившиеся после версии текущего каталога.
+
+    Вызывается по уведомлению об изменении каталога (его может прислать парсер,
+    запущенный любым экземпляром бота) и после обновления каталога этим ботом.
+    """
+    global catalog
+    if catalog.version is None:
+        # Каталог еще не загружался из БД - загружаем целиком
+        await reload_catalog()
+        return
 
-    if not products_df.empty:
-        # Создаем копию DataFrame для сортировки
-        sorted_products_df = products_df.copy()
+    async with catalog_lock:
+        current = catalog
+        changed_df, deleted_ids, version = await run_db(load_changed_products, current.version)
+        if changed_df.empty and not deleted_ids:
+            return
 
-        # Преобразуем строковые цены в числовые для сортировки
-        sorted_products_df['price_numeric'] = sorted_products_df['price'].apply(extract_price)
+        # Парсер удалил из БД file_id изменившихся изображений - убираем их и из памяти
+        old_images = []
+        for product in changed_df.itertuples():
+            old = current.get(int(product.id))
+            if old is not None and old['image'] != product.image:
+                old_images.append(old['image'])
+        photo_cache.discard(old_images)
 
-        # Сортируем копию по цене
-        sorted_products_df = sorted_products_df.sort_values(by='price_numeric', ascending=by_price)
+        catalog = current.updated(changed_df, deleted_ids, version)
+    logging.info(f"Каталог обновлен: изменено товаров {len(changed_df)}, удалено {len(deleted_ids)}, "
+                 f"всего {len(catalog)}")
 
-        # Удаляем временную колонку с числовыми ценами
-        sorted_products_df = sorted_products_df.drop(columns=['price_numeric'])
 
-        # Показать товары после сортировки
-        await show_products(update, context, sorted_products_df)  # Передаем отсортированные данные
-    else:
-        await update.message.reply_text("Нет товаров для сортировки.")
+# Фоновое обновление каталога (одновременно выполняется не больше одного)
+# Плановое обновление выполняет только один из экземпляров бота (claim_catalog_refresh)
+refresher = CatalogRefresher(run_parser, sync_catalog, interval=config.CATALOG_REFRESH_INTERVAL,
+                             claim=claim_catalog_refresh)
 
-async def update_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обновляет список товаров, вызывая парсер и перезагружая данные."""
-    try:
-        # Сообщаем пользователю, что обновление началось
-        await update.callback_query.message.reply_text("Обновление списка товаров началось. Пожалуйста, подождите...")
+# Подписка на изменения каталога в БД: так все экземпляры бота получают
+# изменения, загруженные парсером любого из них, и изменения корзин
+catalog_listener = CatalogListener(CATALOG_CHANNEL, sync_catalog, handlers={CART_CHANNEL: on_cart_notification})
 
-        # Предположим, что парсер - это внешний скрипт, который нужно запустить
-        # Можно использовать subprocess для вызова вашего парсера, если это отдельный файл
-        result = subprocess.run([r"D:\flowers\.venv\Scripts\python.exe", r"D:\flowers\parser\parser.py"],
-        capture_output=True, text=True
-        )
 
-        if result.returncode == 0:
-            # Если парсер успешно завершился, очищаем и перезагружаем список товаров
-            global products_df
+async def update_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновляет список товаров в фоне и сообщает о ходе обновления, не блокируя бота."""
+    query = update.callback_query
+    if refresher.running:
+        status = await query.message.reply_text("Обновление уже выполняется, дождитесь его завершения...")
+    else:
+        status = await query.message.reply_text("Обновление списка товаров началось. Пожалуйста, подождите...")
 
-            # Очищаем текущие данные
-            products_df = pd.DataFrame()
+    shown = {'text': status.text, 'done': False}
 
-            # Загружаем обновленные данные
-            products_df = load_products()
+    async def on_progress(text):
+        # Показываем ход обновления, редактируя одно и то же сообщение
+        if not shown['done'] and text != shown['text']:
+            shown['text'] = text
+            await status.edit_text(text)
 
+    async def report_refresh():
+        success = await refresher.refresh(on_progress)
+        shown['done'] = True
+        if success:
             # Отправляем сообщение об успешном обновлении
-            await update.callback_query.message.reply_text("Данные успешно обновлены!")
+            await status.edit_text("Данные успешно обновлены!")
         else:
-            # Если произошла ошибка в парсере
-            logging.error(f"Ошибка при запуске парсера: {result.stderr}")
-            await update.callback_query.message.reply_text("Произошла ошибка при обновлении данных. Пожалуйста, попробуйте снова позже.")
+            await status.edit_text("Произошла ошибка при обновлении данных. Пожалуйста, попробуйте снова позже.")
+
+    # Обработчик не ждет окончания обновления: оно идет в отдельной задаче приложения,
+    # а ошибки этой задачи попадают в обработчики ошибок вместе с update
+    context.application.create_task(report_refresh(), update=update)
+
+
+async def show_search_results(update: Update, products, next_callback):
+    """Отображает найденные товары; next_callback - callback_data кнопки следующей страницы или None.
+
+    products = None - поиск не выполнен из-за ошибки БД (в отличие от пустого результата).
+    """
+    message = update.effective_message
+    if products is None:
+        await message.reply_text("Произошла ошибка при поиске товаров. Пожалуйста, попробуйте позже.")
+        return
+    if not products:
+        await message.reply_text("Ничего не найдено.")
+        return
+
+    keyboard = [
+        [InlineKeyboardButton(f"{product['name']} - {product['price']}",
+                              callback_data=router.encode('product', product['id']))]
+        for product in products
+    ]
+    if next_callback is not None:
+        keyboard.append([InlineKeyboardButton('Показать еще', callback_data=next_callback)])
+    keyboard.append([InlineKeyboardButton("Главное меню", callback_data='main_menu')])
+    await message.reply_text("Найденные товары:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def show_name_search(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, after_id: int = 0):
+    """Показывает страницу результатов поиска по названию."""
+    found = await run_db(search.search_by_name, text, after_id, ITEMS_PER_PAGE)
+    if found is None:
+        await show_search_results(update, None, None)
+        return
+    products, has_more = found
+    next_callback = await name_search_callback(text, products[-1]['id']) if has_more else None
+    await show_search_results(update, products, next_callback)
+
+
+async def name_search_callback(text: str, after_id: int):
+    """callback_data кнопки "Показать еще" для поиска по названию.
+
+    Текст запроса передается в самой кнопке, чтобы каждое сообщение листало свой запрос;
+    если он не помещается в callback_data, в кнопку попадает ключ запроса, сохраненного в БД.
+    """
+    try:
+        return router.encode('search_name', after_id, text)
+    except ValueError:
+        pass
+    key = await run_db(search.save_query, text)
+    return router.encode('search_name_key', after_id, key) if key is not None else None
+
+
+async def show_price_search(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            min_price: float, max_price: float, after=None):
+    """Показывает страницу результатов поиска по диапазону цен."""
+    found = await run_db(search.search_by_price, min_price, max_price, after, ITEMS_PER_PAGE)
+    if found is None:
+        await show_search_results(update, None, None)
+        return
+    products, has_more = found
+    next_callback = None
+    if has_more:
+        last = products[-1]
+        next_callback = router.encode('search_price', min_price, max_price, last['price_value'], last['id'])
+    await show_search_results(update, products, next_callback)
+
+
+# Обработчик команды /search
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ищет товары по названию: /search <текст>."""
+    text = ' '.join(context.args).strip()
+    if not text:
+        await update.message.reply_text("Укажите текст для поиска, например: /search розы")
+        return
+
+    await show_name_search(update, context, text)
+
+
+# Обработчик команды /price
+async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ищет товары в диапазоне цен: /price <от> <до> или /price <до>."""
+    try:
+        values = [float(arg.replace(',', '.')) for arg in context.args]
+    except ValueError:
+        values = []
+    if len(values) == 1:
+        values = [0, values[0]]
+    # float() принимает и "nan", и "inf" - такие границы не подходят
+    if len(values) != 2 or not all(math.isfinite(value) for value in values):
+        await update.message.reply_text("Укажите диапазон цен, например: /price 1000 3000")
+        return
+
+    min_price, max_price = sorted(values)
+    await show_price_search(update, context, min_price, max_price)
 
-    except Exception as e:
-        # Если ошибка в процессе
-        logging.error(f"Ошибка при обновлении списка товаров: {e}")
-        await update.callback_query.message.reply_text("Произошла ошибка при обновлении данных. Пожалуйста, попробуйте снова позже.")
 
 # Функция для отображения помощи
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -520,50 +846,182 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "- Нажмите на кнопку 'Показать корзину', чтобы посмотреть товары добавленные в корзину.\n"
         "- Нажмите на кнопку 'Получить помощь', чтобы получить помощь.\n"
         "- Нажмите на кнопку 'Обновить список товаров', чтобы обновить данные.\n"
-        "- Нажмите на кнопку 'Перейти на главную страницу', чтобы перейти на сайт."
+        "- Нажмите на кнопку 'Перейти на главную страницу', чтобы перейти на сайт.\n"
+        "- Команда /search <текст> ищет товары по названию.\n"
+        "- Команда /price <от> <до> ищет товары в диапазоне цен."
     )
     await update.callback_query.message.reply_text(help_message)
 
-def add_user_to_db(telegram_user_id: int, username: str = None):
-    """Добавляет нового пользователя в базу данных, если его там нет."""
-    try:
-        # Подключаемся к базе данных
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        # Проверяем, существует ли пользователь с таким Telegram ID
-        cursor.execute("SELECT id FROM users WHERE telegram_user_id = %s", (telegram_user_id,))
-        existing_user = cursor.fetchone()
-
-        if existing_user is None:
-            # Если пользователя нет, добавляем нового
-            cursor.execute(
-                "INSERT INTO users (telegram_user_id, username) VALUES (%s, %s)",
-                (telegram_user_id, username)
-            )
-            conn.commit()  # Подтверждаем изменения
-            logging.info(f"Пользователь с Telegram ID {telegram_user_id} был добавлен в базу данных.")
-        else:
-            logging.info(f"Пользователь с Telegram ID {telegram_user_id} уже существует в базе данных.")
+@metrics.timed('db')
+def load_known_users():
+    """Возвращает telegram_user_id всех пользователей из базы данных (используется кэшем пользователей)."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        # Схема БД должна быть актуальной: нужен уникальный индекс по telegram_user_id
+        ensure_migrations(cursor)
+        cursor.execute("SELECT telegram_user_id FROM users")
+        return [row[0] for row in cursor.fetchall()]
+
+
+@metrics.timed('db')
+def add_users_to_db(users):
+    """Добавляет пользователей одним запросом; уже существующие пропускаются.
+
+    users - список кортежей (telegram_user_id, username).
+    """
+    with get_connection() as conn, conn.cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO users (telegram_user_id, username) VALUES %s
+            ON CONFLICT (telegram_user_id) DO NOTHING
+        """, users, page_size=len(users))
+        logging.info(f"Добавлено пользователей в базу данных: {cursor.rowcount} из {len(users)}")
+
+
+# Кэш пользователей, уже записанных в таблицу users
+user_registry = UserRegistry(load_known_users, add_users_to_db)
+
+
+async def on_startup(application: Application):
+    """Загружает каталог, подписывается на его изменения, запускает плановое обновление каталога
+    и фоновую запись корзин."""
+    if config.METRICS_PORT:
+        metrics.start_server(config.METRICS_PORT)
+
+    global catalog
+    started = time.perf_counter()
+    snapshot = await asyncio.to_thread(load_snapshot_catalog)
+    if snapshot is not None:
+        # Каталог из снимка доступен сразу; из БД догружаются только изменения после снимка
+        catalog = snapshot
+        logging.info(f"Каталог загружен из снимка: {len(catalog)} товаров за {time.perf_counter() - started:.2f} с")
+        try:
+            await sync_catalog()
+        except Exception as e:
+            logging.error(f"Не удалось догрузить изменения каталога из БД: {e}")
+        await run_db(photo_cache.load)
+    else:
+        await reload_catalog()
+    logging.info(f"Каталог загружен: {len(catalog)} товаров за {time.perf_counter() - started:.2f} с")
+    await run_db(user_registry.load)
+
+    catalog_listener.start()
+    refresher.start()
+    cart_cache.start()
+
+
+async def on_shutdown(application: Application):
+    """Останавливает обновление каталога и закрывает пул соединений с БД при остановке бота."""
+    await refresher.stop()
+    await catalog_listener.stop()
+    # Дожидаемся записи новых пользователей до записи их корзин
+    await user_registry.stop()
+    # Записываем в БД изменения корзин, которые еще не были сброшены
+    await cart_cache.stop()
+    close_pool()
+    router.log_stats()
+    metrics.stop_server()
+
+
+# Действия кнопок: имя действия, обработчик и типы аргументов из callback_data
+router.add('show_products', show_products)
+router.add('show_cart', show_cart)
+router.add('sort_products', show_sort_options)
+router.add('sort_products_price', show_sort_options_price)
+router.add('help', show_help)
+router.add('update_products', update_products)
+router.add('main_menu', return_to_main_menu)
+router.add('sort_asc', partial(sort_products, ascending=True))
+router.add('sort_desc', partial(sort_products, ascending=False))
+router.add('sort_price_asc', partial(sort_products_price, by_price=True))
+router.add('sort_price_desc', partial(sort_products_price, by_price=False))
+router.add('clear_cart', clear_user_cart)
+router.add('noop', noop)
+router.add('outdated', outdated_button)
+router.add('product', show_product, int)
+router.add('add_to_cart', add_product_to_cart, int)
+router.add('remove_from_cart', remove_product_from_cart, int)
+router.add('page', turn_page, str, int)
+router.add('catalog', turn_catalog_page, str, str, str, int)
+router.add('search_name', next_name_search, int, str)
+router.add('search_name_key', next_saved_name_search, int, str)
+router.add('search_expired', search_expired)
+router.add('search_price', next_price_search, float, float, float, int)
+
+# Кнопки старого формата "{действие}_{аргументы}" из уже отправленных сообщений.
+# Кнопки товаров по id бывают только в формате v1, старые кнопки товаров считаются устаревшими
+router.legacy('product', 'outdated', lambda rest: [])
+router.legacy('add_to_cart', 'outdated', lambda rest: [])
+router.legacy('remove_from_cart', 'outdated', lambda rest: [])
+router.legacy('page', 'page')
+router.legacy('next', 'page', parse_legacy_next)
+router.legacy('search_name', 'search_expired', lambda rest: [])
+router.legacy('search_price', 'search_price')
+
+
+def build_application(builder=None, concurrent_updates=config.CONCURRENT_UPDATES):
+    """Создает приложение бота с зарегистрированными обработчиками.
+
+    builder - необязательный ApplicationBuilder с уже заданными параметрами
+    (например, адресом Bot API для нагрузочного тестирования); по умолчанию
+    используется токен из config.
+
+    Обновления разных пользователей обрабатываются параллельно (не больше
+    concurrent_updates одновременно): обработчики ждут запросов к БД в потоках
+    run_db, и медленный запрос одного пользователя не задерживает остальных.
+    0 - обрабатывать обновления по одному (только для сравнения в нагрузочном тесте).
+    """
+    if builder is None:
+        # Вставьте сюда токен вашего бота
+        builder = Application.builder().token(config.BOT_TOKEN)
+
+    application = (
+        builder
+        .concurrent_updates(PerUserUpdateProcessor(concurrent_updates) if concurrent_updates else False)
+        # Запросы к Bot API (кроме длинного опроса getUpdates) учитываются в метриках
+        .request(InstrumentedRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    # Регистрируем обработчики
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("price", price_command))
+    application.add_handler(CallbackQueryHandler(button))
+    return application
 
-        cursor.close()
-        conn.close()
-    except psycopg2.Error as e:
-        logging.error(f"Ошибка при добавлении пользователя в базу данных: {e}")
 
 # Основная функция для запуска бота
-def main():
-    # Вставьте сюда токен вашего бота
-    TOKEN = config.BOT_TOKEN
+def webhook_secret_token():
+    """Секрет webhook: из настроек, а если он не задан - производный от токена бота.
 
-    application = Application.builder().token(TOKEN).build()
+    Без секрета любой, кто знает адрес webhook, может отправлять боту поддельные
+    обновления. Производный секрет одинаков во всех экземплярах бота (случайный
+    секрет каждого экземпляра заменял бы в setWebhook секреты остальных) и не
+    раскрывает сам токен.
+    """
+    if config.WEBHOOK_SECRET_TOKEN:
+        return config.WEBHOOK_SECRET_TOKEN
+    logging.info("WEBHOOK_SECRET_TOKEN не задан, используется секрет, производный от токена бота")
+    return hmac.new(config.BOT_TOKEN.encode('utf-8'), b'webhook-secret-token', hashlib.sha256).hexdigest()
 
-    # Регистрируем обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button))
+
+def main():
+    application = build_application()
 
     # Запускаем бота
-    application.run_polling()
+    if config.WEBHOOK_URL:
+        # Telegram сам присылает обновления на встроенный HTTP-сервер
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+            secret_token=webhook_secret_token(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
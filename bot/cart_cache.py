@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from db.pool import run_db
+
+
+class CartCache:
+    """Кэш корзин пользователей с отложенной записью в таблицу cart.
+
+    Чтение корзины обслуживается из памяти (LRU с ограничением по количеству
+    пользователей и времени жизни записи). Изменения сразу применяются к кэшу,
+    а в БД попадают пакетами: раз в flush_interval секунд или как только
+    накопится max_pending изменений. Поэтому данные в БД отстают от кэша не
+    больше чем на flush_interval, а при остановке бота сбрасываются полностью.
+    Корзины, измененные другими экземплярами бота, сбрасываются из кэша через
+    invalidate (по уведомлениям из БД) и при следующем чтении загружаются заново.
+
+    load_cart(telegram_user_id) -> {product_id: quantity} - синхронная загрузка корзины из БД.
+    apply_changes(clears, deltas) - синхронная запись пакета изменений в БД: clears -
+    список пользователей, чьи корзины надо очистить, deltas - {(telegram_user_id, product_id): изменение}.
+    """
+
+    def __init__(self, load_cart, apply_changes, max_users=10000, ttl=300,
+                 flush_interval=2.0, max_pending=500):
+        self.load_cart = load_cart
+        self.apply_changes = apply_changes
+        self.max_users = max_users
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # telegram_user_id -> (время загрузки, {product_id: quantity}), порядок - LRU
+        self._carts = OrderedDict()
+        # Изменения, еще не записанные в БД
+        self._clears = set()
+        self._deltas = {}
+
+        # Загрузки из БД и запись изменений не должны пересекаться, иначе загруженная
+        # корзина может не учесть изменения, записанные во время загрузки
+        self._condition = asyncio.Condition()
+        self._loading = 0
+        self._flushing = False
+        # Увеличивается при каждом сбросе кэша: корзина, загрузка которой началась
+        # до сброса, могла не увидеть изменений других экземпляров и не сохраняется
+        self._generation = 0
+
+        self._flush_task = None
+        self._flush_requested = asyncio.Event()
+
+    @property
+    def pending(self):
+        return len(self._clears) + len(self._deltas)
+
+    async def get(self, telegram_user_id: int) -> dict:
+        """Возвращает корзину пользователя {product_id: quantity}."""
+        entry = self._carts.get(telegram_user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self._carts.move_to_end(telegram_user_id)
+            return entry[1]
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._flushing)
+            self._loading += 1
+        generation = self._generation
+        try:
+            items = await run_db(self.load_cart, telegram_user_id)
+        finally:
+            async with self._condition:
+                self._loading -= 1
+                self._condition.notify_all()
+
+        # Применяем изменения, которые еще не записаны в БД
+        if telegram_user_id in self._clears:
+            items = {}
+        for (user_id, product_id), delta in self._deltas.items():
+            if user_id == telegram_user_id:
+                quantity = items.get(product_id, 0) + delta
+                if quantity > 0:
+                    items[product_id] = quantity
+                else:
+                    items.pop(product_id, None)
+
+        if generation == self._generation:
+            self._store(telegram_user_id, items)
+        return items
+
+    def invalidate(self, user_ids):
+        """Сбрасывает из кэша корзины пользователей, измененные другим экземпляром бота.
+
+        Изменения, еще не записанные в БД, не теряются: они применяются к корзине
+        при следующей загрузке.
+        """
+        self._generation += 1
+        for telegram_user_id in user_ids:
+            self._carts.pop(telegram_user_id, None)
+
+    def invalidate_all(self):
+        """Сбрасывает весь кэш (например, если уведомления об изменениях могли быть пропущены)."""
+        self._generation += 1
+        self._carts.clear()
+
+    def _store(self, telegram_user_id, items):
+        self._carts[telegram_user_id] = (time.monotonic(), items)
+        self._carts.move_to_end(telegram_user_id)
+        while len(self._carts) > self.max_users:
+            self._carts.popitem(last=False)
+
+    def _changed(self):
+        if self.pending >= self.max_pending:
+            self._flush_requested.set()
+
+    async def add(self, telegram_user_id: int, product_id: int, quantity: int = 1):
+        """Добавляет товар в корзину."""
+        items = await self.get(telegram_user_id)
+        items[product_id] = items.get(product_id, 0) + quantity
+
+        key = (telegram_user_id, product_id)
+        self._deltas[key] = self._deltas.get(key, 0) + quantity
+        self._changed()
+
+    async def remove(self, telegram_user_id: int, product_id: int, quantity: int = 1) -> bool:
+        """Уменьшает количество товара в корзине. Возвращает False, если товара в корзине нет."""
+        items = await self.get(telegram_user_id)
+        current = items.get(product_id, 0)
+        if current <= 0:
+            return False
+
+        removed = min(quantity, current)
+        if current > removed:
+            items[product_id] = current - removed
+        else:
+            del items[product_id]
+
+        key = (telegram_user_id, product_id)
+        self._deltas[key] = self._deltas.get(key, 0) - removed
+        self._changed()
+        return True
+
+    def clear(self, telegram_user_id: int):
+        """Очищает корзину пользователя."""
+        self._store(telegram_user_id, {})
+        for key in [key for key in self._deltas if key[0] == telegram_user_id]:
+            del self._deltas[key]
+        self._clears.add(telegram_user_id)
+        self._changed()
+
+    async def flush(self):
+        """Записывает накопленные изменения в БД одним пакетом."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._loading and not self._flushing)
+            if not self.pending:
+                return
+            self._flushing = True
+            clears, self._clears = self._clears, set()
+            deltas, self._deltas = self._deltas, {}
+
+        try:
+            await run_db(self.apply_changes, list(clears), {k: v for k, v in deltas.items() if v})
+        except Exception as e:
+            logging.error(f"Ошибка записи корзин в базу данных, повторим позже: {e}")
+            # Возвращаем изменения в очередь перед теми, что накопились во время записи.
+            # Если корзину успели очистить заново, старые изменения этого пользователя не нужны.
+            cleared_since = set(self._clears)
+            self._clears |= clears
+            for key, delta in deltas.items():
+                if key[0] not in cleared_since:
+                    self._deltas[key] = self._deltas.get(key, 0) + delta
+        finally:
+            async with self._condition:
+                self._flushing = False
+                self._condition.notify_all()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self):
+        """Запускает периодическую запись изменений в БД."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Останавливает периодическую запись и сбрасывает оставшиеся изменения."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
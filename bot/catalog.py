@@ -0,0 +1,170 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+# Колонки каталога товаров
+COLUMNS = ['id', 'name', 'link', 'price', 'image', 'price_value', 'price_from', 'image_hash']
+
+# Порядки сортировки: ключ -> (колонка, по возрастанию). None - порядок из базы данных
+ORDERS = {
+    'default': None,
+    'name_asc': ('name', True),
+    'name_desc': ('name', False),
+    'price_asc': ('price_value', True),
+    'price_desc': ('price_value', False),
+}
+
+# Короткие коды порядков сортировки для callback_data (ограничена 64 байтами)
+ORDER_CODES = {
+    'default': 'd',
+    'name_asc': 'na',
+    'name_desc': 'nd',
+    'price_asc': 'pa',
+    'price_desc': 'pd',
+}
+CODE_ORDERS = {code: order for order, code in ORDER_CODES.items()}
+
+
+def parse_prices(prices: pd.Series) -> pd.Series:
+    """Векторно извлекает числа из строк цен ('от 1 550 ₽' -> 1550.0), как extract_price.
+
+    Нужна только для товаров, у которых в БД еще нет числовой цены.
+    """
+    digits = prices.fillna('').astype(str).str.replace(r'[^\d]', '', regex=True)
+    return pd.to_numeric(digits, errors='coerce').fillna(0).astype(float)
+
+
+class Catalog:
+    """Каталог товаров, который строится один раз после загрузки из БД.
+
+    Числовые цены берутся из БД (price_value), а все порядки сортировки заранее
+    вычисляются как массивы позиций. Поэтому выдача страницы в любом порядке -
+    это срез длиной в страницу, без копирования и сортировки DataFrame.
+
+    Каталог не изменяется после создания: при обновлении строится новый объект
+    и подменяется целиком, поэтому обработчики всегда видят согласованные данные.
+    Поэтому листание идет по ключу (значение сортировки и id товара на краю
+    страницы, см. page_at), а не по номеру страницы: после обновления каталога
+    товары не пропускаются и не повторяются.
+
+    version - время последнего изменения товаров в БД (products.updated_at), на
+    которое актуален каталог; None, если каталог не загружался из БД.
+    """
+
+    def __init__(self, products_df: pd.DataFrame, version=None):
+        self.version = version
+        if products_df.empty:
+            products_df = pd.DataFrame(columns=COLUMNS)
+        self.df = products_df.reset_index(drop=True)
+        if 'price_value' not in self.df:
+            self.df['price_value'] = None
+        if 'price_from' not in self.df:
+            self.df['price_from'] = False
+        if 'image_hash' not in self.df:
+            # SHA-256 локальной копии изображения (image_store.py); None - только URL сайта
+            self.df['image_hash'] = None
+        prices = pd.to_numeric(self.df['price_value'], errors='coerce').astype(float)
+        missing = prices.isna()
+        if missing.any():
+            prices[missing] = parse_prices(self.df.loc[missing, 'price'])
+        self.df['price_value'] = prices
+
+        # Записи товаров в виде словарей, чтобы не обращаться к DataFrame на каждый запрос
+        self.records = self.df.to_dict('records')
+        # Поиск товара по id из БД за O(1)
+        self.by_id = {int(record['id']): record for record in self.records}
+
+        # Товары упорядочены по id (как при загрузке из БД), поэтому устойчивая сортировка
+        # дает порядок (значение, id), а обратный ему - (значение по убыванию, id по убыванию)
+        self._orders = {}
+        # колонка -> ключи (значение, id) в порядке возрастания для поиска позиции по ключу
+        self._keys = {}
+        ids = [int(record['id']) for record in self.records]
+        for order, sort_key in ORDERS.items():
+            if sort_key is None:
+                self._orders[order] = np.arange(len(self.df))
+                self._keys['id'] = [(product_id, product_id) for product_id in ids]
+                continue
+            column, ascending = sort_key
+            positions = np.argsort(self.df[column].to_numpy(), kind='stable')
+            self._orders[order] = positions if ascending else positions[::-1]
+            if column not in self._keys:
+                values = self.df[column].tolist()
+                self._keys[column] = [(values[position], ids[position]) for position in positions]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def empty(self):
+        return not self.records
+
+    def get(self, product_id: int):
+        """Возвращает товар по id из БД или None, если его нет в каталоге."""
+        return self.by_id.get(product_id)
+
+    def page_count(self, per_page: int) -> int:
+        """Количество страниц каталога (не меньше одной)."""
+        return max(1, -(-len(self.records) // per_page))
+
+    def page(self, order: str, page: int, per_page: int) -> list:
+        """Возвращает товары страницы в заданном порядке."""
+        return self.slice(order, page * per_page, per_page)
+
+    def slice(self, order: str, start: int, count: int) -> list:
+        """Возвращает count товаров, начиная с позиции start в заданном порядке."""
+        positions = self._orders[order][start:start + count]
+        return [self.records[position] for position in positions]
+
+    @staticmethod
+    def sort_column(order: str) -> str:
+        sort_key = ORDERS[order]
+        return sort_key[0] if sort_key is not None else 'id'
+
+    def cursor_key(self, order: str, product) -> str:
+        """Значение сортировки товара для ключа листания в виде строки (см. page_at)."""
+        column = self.sort_column(order)
+        if column == 'price_value':
+            return f"{float(product['price_value']):.15g}"
+        if column == 'name':
+            return product['name']
+        return ''
+
+    def _resolve_key(self, order: str, key: str, product_id: int):
+        column = self.sort_column(order)
+        if column == 'price_value':
+            return float(key)
+        if column == 'name':
+            # В кнопке может быть только начало названия: полное берем из каталога, если товар еще в нем
+            product = self.get(product_id)
+            if product is not None and product['name'].startswith(key):
+                return product['name']
+            return key
+        return product_id
+
+    def page_at(self, order: str, direction: str, key: str, product_id: int, per_page: int):
+        """Страница по ключу листания: товары после товара (key, product_id) при direction='>'
+        или перед ним при direction='<'. Товар с ключом может уже отсутствовать в каталоге.
+
+        Возвращает позицию первого товара страницы и список товаров.
+        """
+        keys = self._keys[self.sort_column(order)]
+        cursor = (self._resolve_key(order, key, product_id), product_id)
+        if ORDERS[order] is None or ORDERS[order][1]:
+            # Сколько товаров в этом порядке идет до ключа (включительно и нет)
+            upto, before = bisect_right(keys, cursor), bisect_left(keys, cursor)
+        else:
+            upto, before = len(keys) - bisect_left(keys, cursor), len(keys) - bisect_right(keys, cursor)
+        start = upto if direction == '>' else max(0, before - per_page)
+        return start, self.slice(order, start, per_page)
+
+    def updated(self, changed_df: pd.DataFrame, deleted_ids, version):
+        """Возвращает новый каталог, в котором товары из changed_df добавлены или заменены,
+        а товары с id из deleted_ids удалены. Текущий каталог не изменяется."""
+        replaced = set(deleted_ids) | {int(product_id) for product_id in changed_df['id']}
+        df = self.df[~self.df['id'].astype(int).isin(replaced)][COLUMNS]
+        if not changed_df.empty:
+            df = pd.concat([df, changed_df[COLUMNS]], ignore_index=True)
+        # Порядок по умолчанию - по id, как при полной загрузке
+        return Catalog(df.sort_values('id', kind='stable'), version=version)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+
+import psycopg2
+from psycopg2 import sql
+
+from db.dbconnect import DB_CONFIG
+
+# Параметры TCP keepalive, чтобы обрыв сети обнаруживался и без запросов к БД
+KEEPALIVE_CONFIG = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+
+class CatalogListener:
+    """Подписка на уведомления PostgreSQL об изменении каталога (LISTEN).
+
+    Для подписки используется отдельное соединение вне пула. Его сокет
+    отслеживается циклом событий (add_reader), поэтому ожидание уведомлений не
+    занимает поток. Уведомления, пришедшие подряд, объединяются: on_change
+    вызывается через debounce секунд после первого из них. После
+    переподключения on_change вызывается всегда - уведомления могли быть пропущены.
+
+    on_change - корутина, которая догружает изменения каталога.
+    handlers - необязательный словарь {канал: функция(payload)} для подписки на
+    другие каналы в том же соединении. Функция вызывается сразу на каждое
+    уведомление, а после (пере)подключения - с payload=None.
+    """
+
+    # Период проверки соединения, если цикл событий не поддерживает add_reader (Windows)
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, channel: str, on_change, debounce=1.0, reconnect_delay=5.0, handlers=None):
+        self.channel = channel
+        self.on_change = on_change
+        self.handlers = dict(handlers or {})
+        self.debounce = debounce
+        self.reconnect_delay = reconnect_delay
+        self._task = None
+        self._sync_task = None
+        self._dirty = False
+
+    def start(self):
+        """Запускает подписку на уведомления."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает подписку и дожидается текущей догрузки изменений."""
+        for task in (self._task, self._sync_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._sync_task = None
+
+    def _connect(self):
+        conn = psycopg2.connect(**DB_CONFIG, **KEEPALIVE_CONFIG)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for channel in [self.channel, *self.handlers]:
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+        return conn
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await asyncio.to_thread(self._connect)
+            except psycopg2.Error as e:
+                logging.error(f"Не удалось подписаться на изменения каталога: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            logging.info(f"Подписка на изменения каталога ({self.channel}) установлена")
+            # Изменения, сделанные до подписки, могли пройти без уведомления
+            self._changed()
+            for channel in self.handlers:
+                self._handle(channel, None)
+            try:
+                await self._listen(conn)
+            except psycopg2.Error as e:
+                logging.warning(f"Соединение для уведомлений о каталоге потеряно: {e}")
+            finally:
+                conn.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _listen(self, conn):
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fileno = conn.fileno()
+        try:
+            loop.add_reader(fileno, readable.set)
+            use_reader = True
+        except NotImplementedError:
+            use_reader = False
+
+        try:
+            while True:
+                if use_reader:
+                    await readable.wait()
+                    readable.clear()
+                else:
+                    await asyncio.sleep(self.POLL_INTERVAL)
+                # Читает пришедшие уведомления; при разрыве соединения выбрасывает исключение
+                conn.poll()
+                if conn.notifies:
+                    notifies = list(conn.notifies)
+                    conn.notifies.clear()
+                    for notify in notifies:
+                        if notify.channel == self.channel:
+                            self._changed()
+                        else:
+                            self._handle(notify.channel, notify.payload)
+        finally:
+            if use_reader:
+                loop.remove_reader(fileno)
+
+    def _handle(self, channel, payload):
+        handler = self.handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            handler(payload)
+        except Exception as e:
+            logging.error(f"Ошибка обработки уведомления {channel}: {e}")
+
+    def _changed(self):
+        self._dirty = True
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync())
+
+    async def _sync(self):
+        # Уведомления, пришедшие во время догрузки, вызовут еще одну догрузку
+        while self._dirty:
+            await asyncio.sleep(self.debounce)
+            self._dirty = False
+            try:
+                await self.on_change()
+            except Exception as e:
+                logging.error(f"Ошибка при догрузке изменений каталога: {e}")
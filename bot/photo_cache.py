@@ -0,0 +1,70 @@
+import logging
+import threading
+
+import psycopg2
+
+import metrics
+from db.pool import get_connection
+
+
+class PhotoCache:
+    """Кэш соответствий "URL изображения -> file_id в Telegram".
+
+    После первой отправки фото по URL Telegram возвращает file_id, по которому
+    то же фото можно отправлять повторно без скачивания с сайта. Соответствия
+    хранятся в таблице telegram_file_cache и дублируются в памяти процесса.
+    Парсер удаляет записи для изображений, которые изменились на сайте.
+    """
+
+    def __init__(self):
+        self._file_ids = {}
+        self._lock = threading.Lock()
+
+    @metrics.timed('db')
+    def load(self):
+        """Загружает кэш из базы данных (заменяет содержимое в памяти)."""
+        try:
+            with get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT image_url, file_id FROM telegram_file_cache")
+                file_ids = dict(cursor.fetchall())
+        except psycopg2.Error as e:
+            logging.error(f"Ошибка загрузки кэша фотографий: {e}")
+            return
+        with self._lock:
+            self._file_ids = file_ids
+
+    def get(self, image_url: str):
+        """Возвращает file_id для изображения или None, если фото еще не отправлялось."""
+        return self._file_ids.get(image_url)
+
+    @metrics.timed('db')
+    def remember(self, image_url: str, file_id: str):
+        """Сохраняет file_id отправленного фото в памяти и в базе данных."""
+        with self._lock:
+            self._file_ids[image_url] = file_id
+        try:
+            with get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO telegram_file_cache (image_url, file_id) VALUES (%s, %s)
+                    ON CONFLICT (image_url) DO UPDATE
+                    SET file_id = EXCLUDED.file_id, updated_at = now()
+                """, (image_url, file_id))
+        except psycopg2.Error as e:
+            logging.error(f"Ошибка сохранения file_id фотографии: {e}")
+
+    def discard(self, image_urls):
+        """Удаляет file_id из памяти (записи в БД для изменившихся изображений удаляет парсер)."""
+        with self._lock:
+            for image_url in image_urls:
+                self._file_ids.pop(image_url, None)
+
+    @metrics.timed('db')
+    def forget(self, image_url: str):
+        """Удаляет устаревший file_id (например, если Telegram его больше не принимает)."""
+        with self._lock:
+            self._file_ids.pop(image_url, None)
+        try:
+            with get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("DELETE FROM telegram_file_cache WHERE image_url = %s", (image_url,))
+        except psycopg2.Error as e:
+            logging.error(f"Ошибка удаления file_id фотографии: {e}")
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+
+# Этапы обновления и их описания для пользователя
+STAGES = {
+    'start': "Обновление списка товаров началось. Пожалуйста, подождите...",
+    'fetch': "Загружаем товары с сайта...",
+    'save': "Сохраняем товары...",
+    'images': "Загружаем изображения товаров...",
+    'load': "Загружаем товары в базу данных...",
+    'reload': "Обновляем каталог бота...",
+}
+
+
+class CatalogRefresher:
+    """Фоновое обновление каталога.
+
+    Парсер выполняется в отдельном потоке, поэтому цикл событий бота не блокируется.
+    Одновременно выполняется не больше одного обновления: повторные запросы
+    присоединяются к уже идущему (single-flight) и получают его результат.
+
+    run_parser - синхронная функция парсера, принимающая функцию progress(stage)
+    и возвращающая True при успехе; reload_catalog - корутина, которая загружает
+    новый каталог и подменяет им текущий.
+
+    claim - необязательная синхронная функция claim(interval), которая вызывается
+    перед каждым плановым обновлением: если каталог обновляют несколько экземпляров
+    бота, она возвращает объект с методом close(), пока обновление занято этим
+    экземпляром, или None - тогда плановое обновление пропускается.
+    """
+
+    def __init__(self, run_parser, reload_catalog, interval=None, claim=None):
+        self.run_parser = run_parser
+        self.reload_catalog = reload_catalog
+        self.interval = interval
+        self.claim = claim
+        self.stage = None
+        self._task = None
+        self._periodic_task = None
+        self._listeners = []
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def refresh(self, on_progress=None):
+        """Запускает обновление или присоединяется к уже идущему. Возвращает True при успехе.
+
+        on_progress - необязательная корутина, которая получает описание каждого этапа.
+        """
+        if on_progress is not None:
+            self._listeners.append(on_progress)
+            if self.stage is not None:
+                await self._notify(on_progress, self.stage)
+
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+        try:
+            # shield: отмена одного из ожидающих не должна прерывать общее обновление
+            return await asyncio.shield(self._task)
+        finally:
+            if on_progress is not None and on_progress in self._listeners:
+                self._listeners.remove(on_progress)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        def progress(stage):
+            # Вызывается из потока парсера
+            loop.call_soon_threadsafe(self._set_stage, stage)
+
+        try:
+            self._set_stage('start')
+            success = await asyncio.to_thread(self.run_parser, progress)
+            if not success:
+                logging.error("Парсер завершился с ошибкой, каталог не обновлен")
+                return False
+
+            self._set_stage('reload')
+            await self.reload_catalog()
+            logging.info("Каталог товаров обновлен")
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении списка товаров: {e}")
+            return False
+        finally:
+            self.stage = None
+
+    def _set_stage(self, stage):
+        self.stage = stage
+        for listener in list(self._listeners):
+            asyncio.create_task(self._notify(listener, stage))
+
+    @staticmethod
+    async def _notify(listener, stage):
+        try:
+            await listener(STAGES.get(stage, stage))
+        except Exception as e:
+            logging.warning(f"Не удалось сообщить о ходе обновления: {e}")
+
+    async def _periodic(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            lease = None
+            if self.claim is not None:
+                try:
+                    # Допуск 10%: таймеры экземпляров бота срабатывают не одновременно
+                    lease = await asyncio.to_thread(self.claim, self.interval * 0.9)
+                except Exception as e:
+                    logging.error(f"Не удалось занять плановое обновление каталога: {e}")
+                    continue
+                if lease is None:
+                    logging.info("Плановое обновление каталога выполняет другой экземпляр бота")
+                    continue
+            try:
+                logging.info("Плановое обновление каталога")
+                await self.refresh()
+            finally:
+                if lease is not None:
+                    await asyncio.to_thread(lease.close)
+
+    def start(self):
+        """Запускает периодическое обновление (если задан интервал)."""
+        if self.interval and self._periodic_task is None:
+            self._periodic_task = asyncio.create_task(self._periodic())
+
+    async def stop(self):
+        """Останавливает периодическое обновление и дожидается текущего."""
+        if self._periodic_task is not None:
+            self._periodic_task.cancel()
+            self._periodic_task = None
+        if self.running:
+            await asyncio.wait([self._task])
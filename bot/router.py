@@ -0,0 +1,175 @@
+import logging
+import time
+
+# Формат callback_data: "v1:действие:аргумент1:аргумент2..."
+CALLBACK_VERSION = 'v1'
+SEPARATOR = ':'
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+
+
+class CallbackDataError(ValueError):
+    """callback_data не удалось разобрать или для нее нет обработчика."""
+
+
+class RouteStats:
+    """Статистика обработчика: количество вызовов, ошибок и время выполнения (сек)."""
+
+    __slots__ = ('calls', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def average(self):
+        return self.total / self.calls if self.calls else 0.0
+
+
+class CallbackRouter:
+    """Маршрутизатор нажатий на inline-кнопки.
+
+    Обработчики регистрируются по имени действия вместе с типами аргументов,
+    а выбор обработчика - это поиск в словаре, а не перебор условий.
+    callback_data кодируется и разбирается здесь же (encode/decode), поэтому
+    обработчики получают уже преобразованные аргументы.
+
+    Кнопки в старых сообщениях ("page_na_2", "next_name_asc_2") продолжают
+    работать: их префиксы регистрируются через legacy и ищутся в отдельной таблице.
+    Для каждого действия собирается статистика времени выполнения, а если задан
+    observer, то он получает каждое измерение: observer(действие, время, ошибка).
+    """
+
+    def __init__(self, observer=None):
+        self.observer = observer
+        # действие -> (обработчик, типы аргументов)
+        self._routes = {}
+        # префикс старого формата -> (действие, функция разбора остатка строки)
+        self._legacy = {}
+        self.stats = {}
+
+    def add(self, action: str, handler, *arg_types):
+        """Регистрирует обработчик handler(update, context, *args) для действия."""
+        if SEPARATOR in action:
+            raise ValueError(f"Имя действия не может содержать '{SEPARATOR}': {action}")
+        if action in self._routes:
+            raise ValueError(f"Обработчик для действия '{action}' уже зарегистрирован")
+        self._routes[action] = (handler, arg_types)
+        self.stats[action] = RouteStats()
+
+    def route(self, action: str, *arg_types):
+        """Декоратор для регистрации обработчика действия."""
+        def decorator(handler):
+            self.add(action, handler, *arg_types)
+            return handler
+        return decorator
+
+    def legacy(self, prefix: str, action: str, parse=None):
+        """Регистрирует старый формат "{prefix}_{аргументы}" для действия.
+
+        parse(rest) возвращает аргументы из остатка строки после префикса;
+        по умолчанию остаток разбивается по '_'.
+        """
+        self._legacy[prefix] = (action, parse or (lambda rest: rest.split('_')))
+
+    def encode(self, action: str, *args) -> str:
+        """Кодирует действие и аргументы в callback_data."""
+        handler, arg_types = self._routes[action]
+        if len(args) != len(arg_types):
+            raise ValueError(f"Действие '{action}' ожидает {len(arg_types)} аргументов, передано {len(args)}")
+        if not args:
+            # Действия без аргументов кодируются одним именем, как и раньше
+            return action
+
+        parts = [CALLBACK_VERSION, action]
+        for value, arg_type in zip(args, arg_types):
+            value = arg_type(value)
+            if arg_type is float:
+                # Без экспоненты и лишних нулей: 1550.0 -> '1550'
+                value = f"{value:.15g}"
+            value = str(value)
+            if SEPARATOR in value:
+                raise ValueError(f"Аргумент callback_data не может содержать '{SEPARATOR}': {value}")
+            parts.append(value)
+
+        data = SEPARATOR.join(parts)
+        if len(data.encode('utf-8')) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data}")
+        return data
+
+    def decode(self, data: str):
+        """Разбирает callback_data и возвращает (действие, аргументы)."""
+        if data in self._routes:
+            action, args = data, []
+        elif SEPARATOR in data:
+            version, action, *args = data.split(SEPARATOR)
+            if version != CALLBACK_VERSION:
+                raise CallbackDataError(f"Неизвестная версия callback_data: {data}")
+        else:
+            action, args = self._decode_legacy(data)
+
+        route = self._routes.get(action)
+        if route is None:
+            raise CallbackDataError(f"Нет обработчика для callback_data: {data}")
+        arg_types = route[1]
+        if len(args) != len(arg_types):
+            raise CallbackDataError(f"Неверное количество аргументов в callback_data: {data}")
+        try:
+            return action, [arg_type(value) for value, arg_type in zip(args, arg_types)]
+        except ValueError:
+            raise CallbackDataError(f"Неверные аргументы в callback_data: {data}") from None
+
+    def _decode_legacy(self, data: str):
+        # Ищем самый длинный зарегистрированный префикс, отбрасывая части после '_' справа
+        prefix, rest = data, ''
+        while '_' in prefix:
+            prefix, _, tail = prefix.rpartition('_')
+            rest = f"{tail}_{rest}" if rest else tail
+            legacy = self._legacy.get(prefix)
+            if legacy is not None:
+                action, parse = legacy
+                try:
+                    return action, list(parse(rest))
+                except ValueError:
+                    raise CallbackDataError(f"Неверные аргументы в callback_data: {data}") from None
+        raise CallbackDataError(f"Нет обработчика для callback_data: {data}")
+
+    async def dispatch(self, update, context):
+        """Обработчик CallbackQueryHandler: отвечает на нажатие и вызывает обработчик действия."""
+        query = update.callback_query
+        await query.answer()
+
+        try:
+            action, args = self.decode(query.data)
+        except CallbackDataError as e:
+            logging.warning(str(e))
+            return
+
+        handler = self._routes[action][0]
+        started = time.perf_counter()
+        failed = True
+        try:
+            await handler(update, context, *args)
+            failed = False
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats[action].record(elapsed, failed)
+            if self.observer is not None:
+                self.observer(action, elapsed, failed)
+
+    def log_stats(self):
+        """Выводит в лог статистику по действиям, которые вызывались."""
+        for action, stats in sorted(self.stats.items(), key=lambda item: -item[1].total):
+            if stats.calls:
+                logging.info(
+                    f"Кнопка '{action}': вызовов {stats.calls}, ошибок {stats.errors}, "
+                    f"среднее {stats.average * 1000:.1f} мс, максимум {stats.max * 1000:.1f} мс"
+                )
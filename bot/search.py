@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import logging
+
+import psycopg2
+
+import metrics
+from db.pool import get_connection
+
+# Колонки товаров, которые возвращает поиск
+SEARCH_COLUMNS = ['id', 'name', 'price', 'price_value']
+
+
+def query_key(text: str) -> str:
+    """Короткий ключ текста запроса для callback_data (одинаковый во всех экземплярах бота)."""
+    digest = hashlib.sha256(text.encode('utf-8')).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode('ascii')
+
+
+@metrics.timed('db')
+def save_query(text: str):
+    """Сохраняет текст запроса в БД и возвращает его ключ (query_key) или None при ошибке."""
+    key = query_key(text)
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO search_queries (key, query) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+                (key, text)
+            )
+    except psycopg2.Error as e:
+        logging.error(f"Ошибка сохранения поискового запроса: {e}")
+        return None
+    return key
+
+
+@metrics.timed('db')
+def load_query(key: str):
+    """Возвращает текст запроса, сохраненного save_query, или None, если его нет."""
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT query FROM search_queries WHERE key = %s", (key,))
+            row = cursor.fetchone()
+    except psycopg2.Error as e:
+        logging.error(f"Ошибка чтения поискового запроса: {e}")
+        return None
+    return row[0] if row else None
+
+
+def _escape_like(text: str) -> str:
+    """Экранирует спецсимволы шаблона LIKE во введенном пользователем тексте."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fetch_page(sql, params, limit):
+    """Выполняет запрос страницы (limit + 1 строка) и возвращает (товары, есть_еще).
+
+    При ошибке БД возвращает None, чтобы ее можно было отличить от пустого результата.
+    """
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    except psycopg2.Error as e:
+        logging.error(f"Ошибка поиска товаров: {e}")
+        return None
+
+    products = [dict(zip(SEARCH_COLUMNS, row)) for row in rows[:limit]]
+    return products, len(rows) > limit
+
+
+@metrics.timed('db')
+def search_by_name(text: str, after_id: int = 0, limit: int = 10):
+    """Ищет товары по подстроке в названии (индекс pg_trgm по products.name).
+
+    Пагинация по ключу: следующая страница начинается после товара с id = after_id.
+    Возвращает (товары, есть_еще) или None при ошибке БД.
+    """
+    return _fetch_page("""
+        SELECT id, name, price, price_value
+        FROM products
+        WHERE deleted_at IS NULL AND name ILIKE %s AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (f"%{_escape_like(text)}%", after_id, limit + 1), limit)
+
+
+@metrics.timed('db')
+def search_by_price(min_price: float, max_price: float, after=None, limit: int = 10):
+    """Ищет товары с ценой в диапазоне [min_price, max_price] по возрастанию цены
+    (индекс по products.price_value, id).
+
+    after - ключ последнего показанного товара (price_value, id) или None для первой страницы.
+    Возвращает (товары, есть_еще) или None при ошибке БД.
+    """
+    after_price, after_id = after if after is not None else (-1, 0)
+    return _fetch_page("""
+        SELECT id, name, price, price_value
+        FROM products
+        WHERE deleted_at IS NULL
+          AND price_value BETWEEN %s AND %s
+          AND (price_value, id) > (%s, %s)
+        ORDER BY price_value, id
+        LIMIT %s
+    """, (min_price, max_price, after_price, after_id, limit + 1), limit)
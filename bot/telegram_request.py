@@ -0,0 +1,25 @@
+import time
+
+from telegram.request import HTTPXRequest
+
+import metrics
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который учитывает время каждого запроса к Bot API в метриках.
+
+    Операция называется по методу API (sendMessage, answerCallbackQuery, ...),
+    токен бота из URL в метрики не попадает.
+    """
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        failed = True
+        try:
+            # Таймауты передаются как есть: по умолчанию это DEFAULT_NONE, а не None
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            failed = code >= 400
+            return code, payload
+        finally:
+            metrics.record('telegram', api_method, time.perf_counter() - started, failed)
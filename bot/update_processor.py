@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    max_concurrent_updates), поэтому медленный обработчик не задерживает остальных.
+    Обновления одного пользователя выполняются строго по очереди: если его
+    предыдущее обновление еще обрабатывается, новое ставится в очередь и
+    выполняется той же задачей следом, не занимая еще одно место в лимите.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Ключ пользователя -> очередь его обновлений, ожидающих обработки
+        self._queues = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return 'user', update.effective_user.id
+            if update.effective_chat is not None:
+                return 'chat', update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Предыдущее обновление пользователя еще обрабатывается - его задача выполнит и это
+            queue.append(coroutine)
+            return
+
+        self._queues[key] = queue = deque([coroutine])
+        self._idle.clear()
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception as e:
+                    logging.error(f"Ошибка при обработке обновления: {e}")
+                finally:
+                    queue.popleft()
+        finally:
+            # При отмене задачи оставшиеся обновления уже не будут выполнены
+            for pending in queue:
+                pending.close()
+            del self._queues[key]
+            if not self._queues:
+                self._idle.set()
+
+    async def initialize(self):
+        """Ничего не требуется."""
+
+    async def shutdown(self):
+        """Дожидается обработки обновлений, поставленных в очереди пользователей."""
+        await self._idle.wait()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+from db.pool import run_db
+
+
+class UserRegistry:
+    """Кэш пользователей, уже записанных в таблицу users.
+
+    Кэш заполняется из БД при запуске бота, поэтому повторный /start и проверка
+    пользователя при добавлении в корзину не обращаются к БД. Новые пользователи
+    записываются пакетами: регистрации, пришедшие в течение batch_delay секунд
+    (но не больше batch_size), записываются одним запросом. register дожидается
+    записи своего пакета, так что после него пользователь уже есть в БД.
+
+    load_users() -> итерируемое telegram_user_id - синхронная загрузка всех пользователей.
+    insert_users(users) - синхронная запись списка (telegram_user_id, username);
+    уже существующие пользователи должны пропускаться (ON CONFLICT DO NOTHING).
+    """
+
+    def __init__(self, load_users, insert_users, batch_size=50, batch_delay=0.05):
+        self.load_users = load_users
+        self.insert_users = insert_users
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+
+        self._known = set()
+        # Пользователи, ожидающие записи: telegram_user_id -> username
+        self._pending = {}
+        self._waiters = []
+        self._timer = None
+        self._writes = set()
+
+    def __len__(self):
+        return len(self._known)
+
+    def load(self):
+        """Загружает пользователей из БД (синхронно, вызывается в потоке БД).
+
+        Если загрузить не удалось, кэш заполняется по мере регистраций: запись
+        уже существующего пользователя ничего не меняет.
+        """
+        try:
+            self._known = set(self.load_users())
+        except Exception as e:
+            logging.error(f"Ошибка загрузки пользователей из базы данных: {e}")
+            return
+        logging.info(f"Загружено пользователей: {len(self._known)}")
+
+    def is_known(self, telegram_user_id: int) -> bool:
+        """Есть ли пользователь в БД (по данным кэша)."""
+        return telegram_user_id in self._known
+
+    async def register(self, telegram_user_id: int, username: str = None) -> bool:
+        """Записывает пользователя в БД, если его там еще нет.
+
+        Возвращает True, если пользователь записан сейчас или уже был, и False при ошибке записи.
+        """
+        if telegram_user_id in self._known:
+            return True
+
+        self._pending.setdefault(telegram_user_id, username)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        if len(self._pending) >= self.batch_size:
+            self._write_batch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_delay, self._write_batch)
+        return await waiter
+
+    def _write_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, []
+        task = asyncio.ensure_future(self._write(batch, waiters))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch, waiters):
+        try:
+            await run_db(self.insert_users, list(batch.items()))
+            self._known.update(batch)
+            success = True
+        except Exception as e:
+            logging.error(f"Ошибка при добавлении пользователей в базу данных: {e}")
+            success = False
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(success)
+
+    async def stop(self):
+        """Записывает ожидающих пользователей и дожидается завершения записи."""
+        self._write_batch()
+        if self._writes:
+            await asyncio.wait(list(self._writes))
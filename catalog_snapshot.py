@@ -0,0 +1,185 @@
+"""Снимок каталога товаров в двоичном файле.
+
+Парсер записывает снимок после каждой загрузки товаров в БД, а бот читает его
+при запуске: каталог доступен сразу, без запроса к БД и разбора CSV, и
+продолжает работать, если PostgreSQL временно недоступен.
+
+Формат файла (все числа little-endian):
+    MAGIC (8 байт) | FORMAT_VERSION (uint32) | длина описания (uint32) | описание (JSON)
+    | колонки, каждая с границы 8 байт
+
+Описание содержит версию каталога (время последнего изменения товаров в БД, как
+Catalog.version), количество строк и смещения колонок. Числовые колонки хранятся
+массивами numpy, строковые - одной строкой UTF-8 с разделителем '\\0' (в тексте
+PostgreSQL этот символ невозможен) и маской пустых значений. Файл отображается в
+память (mmap), поэтому числовые колонки читаются без копирования и разбора.
+
+Строковые колонки декодируются целиком при открытии снимка: DataFrame каталога
+все равно хранит строки объектами Python, поэтому ленивое декодирование не
+сократило бы ни время запуска, ни память. Время открытия снимка растет с
+суммарной длиной строк каталога.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+import config
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAGIC = b'FLWCATS\0'
+# Увеличивается при несовместимом изменении формата; снимки другой версии не читаются
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sII')
+ALIGNMENT = 8
+SEPARATOR = '\0'
+
+# Колонки снимка в порядке строк fetch_catalog и их типы
+COLUMNS = [
+    ('id', 'int64'),
+    ('name', 'str'),
+    ('link', 'str'),
+    ('price', 'str'),
+    ('image', 'str'),
+    ('price_value', 'float64'),
+    ('price_from', 'bool'),
+    ('image_hash', 'str'),
+]
+
+
+class SnapshotError(ValueError):
+    """Файл не является снимком каталога или записан в другой версии формата."""
+
+
+def snapshot_path():
+    """Путь к снимку из настроек (config.CATALOG_SNAPSHOT) или None, если снимок отключен."""
+    if not config.CATALOG_SNAPSHOT:
+        return None
+    return os.path.join(ROOT_DIR, config.CATALOG_SNAPSHOT)
+
+
+def fetch_catalog(cursor):
+    """Читает из БД товары каталога и его версию.
+
+    Возвращает список строк (в порядке COLUMNS, пути относительные, как в БД)
+    и версию каталога. Версия читается до товаров: изменения, зафиксированные
+    между запросами, будут догружены еще раз при следующей синхронизации, но не потеряются.
+    """
+    cursor.execute("""
+        SELECT GREATEST((SELECT max(updated_at) FROM products), (SELECT max(fetched_at) FROM image_files))
+    """)
+    version = cursor.fetchone()[0]
+
+    # Товары с локальными копиями изображений
+    cursor.execute("""
+        SELECT p.id, p.name, p.link, p.price, p.image, p.price_value, p.price_from, f.sha256
+        FROM products p
+        LEFT JOIN image_files f ON f.image = p.image
+        WHERE p.deleted_at IS NULL
+        ORDER BY p.id
+    """)
+    return cursor.fetchall(), version
+
+
+def _encode_column(values, kind):
+    """Возвращает части данных колонки: [(ключ описания, байты)]."""
+    if kind == 'str':
+        nulls = np.array([value is None for value in values], dtype=np.bool_)
+        text = SEPARATOR.join('' if value is None else value for value in values)
+        return [('data', text.encode('utf-8')), ('nulls', nulls.tobytes())]
+    if kind == 'float64':
+        values = [np.nan if value is None else float(value) for value in values]
+    elif kind == 'bool':
+        values = [bool(value) for value in values]
+    return [('data', np.array(values, dtype=kind).tobytes())]
+
+
+def write_snapshot(path, rows, version):
+    """Записывает снимок каталога (строки в порядке COLUMNS) атомарно: читатели
+    видят либо прежний, либо новый файл целиком."""
+    rows = list(rows)
+    columns = []
+    chunks = []
+    offset = 0
+    for index, (name, kind) in enumerate(COLUMNS):
+        column = {'name': name, 'type': kind}
+        for key, data in _encode_column([row[index] for row in rows], kind):
+            column[key] = [offset, len(data)]
+            padding = -len(data) % ALIGNMENT
+            chunks.append(data + b'\0' * padding)
+            offset += len(data) + padding
+        columns.append(column)
+
+    description = json.dumps({
+        'version': version.isoformat() if version is not None else None,
+        'rows': len(rows),
+        'columns': columns,
+    }).encode('utf-8')
+    # Колонки начинаются с границы ALIGNMENT после заголовка и описания
+    description += b' ' * (-(HEADER.size + len(description)) % ALIGNMENT)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(description)))
+            file.write(description)
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_snapshot(path):
+    """Читает снимок каталога.
+
+    Возвращает словарь {колонка: значения} (массивы numpy для чисел, списки для
+    строк, декодированные сразу) и версию каталога. Если файл поврежден или записан в другой версии
+    формата, выбрасывает SnapshotError; если файла нет - FileNotFoundError.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise SnapshotError(f"{path}: файл слишком короткий")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, format_version, description_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path}: не снимок каталога")
+    if format_version != FORMAT_VERSION:
+        raise SnapshotError(f"{path}: версия формата {format_version}, поддерживается {FORMAT_VERSION}")
+    try:
+        description = json.loads(data[HEADER.size:HEADER.size + description_size])
+        base = HEADER.size + description_size
+        rows = description['rows']
+
+        values = {}
+        for column in description['columns']:
+            start, size = column['data']
+            start += base
+            if start + size > len(data):
+                raise SnapshotError(f"{path}: файл обрезан")
+            if column['type'] != 'str':
+                # Массив ссылается на отображенный в память файл, а не на копию
+                values[column['name']] = np.frombuffer(data, dtype=column['type'], count=rows, offset=start)
+                continue
+            strings = data[start:start + size].decode('utf-8').split(SEPARATOR) if rows else []
+            if len(strings) != rows:
+                raise SnapshotError(f"{path}: колонка {column['name']} повреждена")
+            nulls_start, _ = column['nulls']
+            nulls = np.frombuffer(data, dtype=np.bool_, count=rows, offset=base + nulls_start)
+            values[column['name']] = [None if null else value for value, null in zip(strings, nulls.tolist())]
+    except SnapshotError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotError(f"{path}: снимок поврежден ({e})") from e
+
+    version = datetime.fromisoformat(description['version']) if description['version'] else None
+    return values, version
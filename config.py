@@ -4,4 +4,41 @@ TARGET_URL = "https://flowersbryansk.ru/catalog/bukety/"
 
 IMAGE_URL = "https://flowersbryansk.ru"
 
+# Корневые страницы категорий, которые обходит парсер
+CATEGORY_URLS = [
+    TARGET_URL,
+]
+
+# Локальная копия изображений товаров: каталог хранилища относительно корня проекта
+# (None - не загружать изображения, бот отправляет их по URL сайта)
+IMAGE_DIR = 'images'
+# Наибольшая сторона уменьшенной копии изображения, px (нужен Pillow); None - отправлять оригиналы
+IMAGE_THUMBNAIL_SIZE = 1280
+
+# Снимок каталога, который записывает парсер и читает бот при запуске (относительно корня проекта);
+# None - не записывать снимок, бот загружает каталог только из БД
+CATALOG_SNAPSHOT = 'parser/catalog.snapshot'
+
+# Интервал автоматического обновления каталога ботом, сек (None - только вручную)
+CATALOG_REFRESH_INTERVAL = 6 * 60 * 60
+
+# Порт HTTP-сервера метрик бота (http://127.0.0.1:9108/metrics); None - не запускать
+METRICS_PORT = 9108
+
+# Операции дольше этого времени, сек, записываются в лог как медленные
+SLOW_OPERATION_THRESHOLD = 1.0
+
+# Сколько обновлений бот обрабатывает одновременно (обновления одного пользователя - по очереди)
+CONCURRENT_UPDATES = 64
+
+# Режим webhook: публичный HTTPS-адрес бота, например "https://bot.example.com".
+# None - бот получает обновления длинным опросом (polling)
+WEBHOOK_URL = None
+WEBHOOK_PATH = 'telegram'          # Путь, на который Telegram отправляет обновления
+WEBHOOK_LISTEN = '0.0.0.0'         # Адрес встроенного HTTP-сервера
+WEBHOOK_PORT = 8443                # Порт встроенного HTTP-сервера
+# Секрет, который Telegram передает в заголовке запроса (символы A-Z, a-z, 0-9, _ и -).
+# None - секрет выводится из BOT_TOKEN, поэтому без секрета webhook не запускается
+WEBHOOK_SECRET_TOKEN = None
+
 
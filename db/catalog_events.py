@@ -0,0 +1,83 @@
+import json
+
+import psycopg2
+
+from db.dbconnect import DB_CONFIG
+
+# Канал уведомлений PostgreSQL об изменении каталога товаров
+CATALOG_CHANNEL = 'catalog_changed'
+# Канал уведомлений об изменении корзин (для сброса кэша корзин в других экземплярах бота)
+CART_CHANNEL = 'cart_changed'
+# Уведомление PostgreSQL ограничено 8000 байт: столько id пользователей точно помещается в одно
+CART_NOTIFY_BATCH = 400
+
+# Идентификатор advisory-блокировки, которая упорядочивает загрузки каталога
+CATALOG_WRITE_LOCK_ID = 7355609
+# Идентификатор advisory-блокировки планового обновления каталога
+CATALOG_REFRESH_LOCK_ID = 7355610
+
+
+def lock_catalog_writes(cursor):
+    """Ждет окончания других загрузок каталога и не дает им начаться до конца транзакции.
+
+    Отметки времени изменений (products.updated_at, image_files.fetched_at) берутся
+    после блокировки, поэтому у следующей загрузки они всегда больше, чем у
+    предыдущей, и бот, догружающий изменения после своей версии, их не пропустит.
+    Чтение товаров блокировка не задерживает.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CATALOG_WRITE_LOCK_ID,))
+
+
+def notify_catalog_changed(cursor, **summary):
+    """Публикует уведомление об изменении каталога в текущей транзакции.
+
+    PostgreSQL доставляет уведомление слушателям только после фиксации транзакции,
+    поэтому боты не увидят его раньше самих изменений. В уведомлении только сводка
+    (например, количество новых и удаленных товаров): сами изменения боты читают
+    из таблицы products по колонке updated_at.
+    """
+    cursor.execute("SELECT pg_notify(%s, %s)", (CATALOG_CHANNEL, json.dumps(summary)))
+
+
+def notify_cart_changed(cursor, instance: str, user_ids):
+    """Публикует в текущей транзакции уведомление об изменении корзин пользователей user_ids.
+
+    instance - идентификатор экземпляра бота, записавшего изменения: свои
+    уведомления он пропускает, его кэш уже содержит эти изменения.
+    """
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), CART_NOTIFY_BATCH):
+        payload = {'instance': instance, 'users': user_ids[start:start + CART_NOTIFY_BATCH]}
+        cursor.execute("SELECT pg_notify(%s, %s)", (CART_CHANNEL, json.dumps(payload)))
+
+
+def claim_catalog_refresh(min_interval: float):
+    """Занимает плановое обновление каталога для этого экземпляра бота.
+
+    Каждый экземпляр запускает плановое обновление по своему таймеру, а выполнить
+    его должен только один: тот, кто первым взял advisory-блокировку, если с начала
+    предыдущего планового обновления прошло не меньше min_interval секунд.
+    Возвращает соединение, которое удерживает блокировку до close(), или None,
+    если обновление выполняет или недавно выполнил другой экземпляр.
+    """
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (CATALOG_REFRESH_LOCK_ID,))
+            if not cursor.fetchone()[0]:
+                conn.close()
+                return None
+            cursor.execute("""
+                INSERT INTO catalog_refresh_runs (name, started_at) VALUES ('periodic', now())
+                ON CONFLICT (name) DO UPDATE SET started_at = EXCLUDED.started_at
+                WHERE catalog_refresh_runs.started_at < now() - make_interval(secs => %s)
+                RETURNING 1
+            """, (min_interval,))
+            if cursor.fetchone() is None:
+                conn.close()
+                return None
+    except BaseException:
+        conn.close()
+        raise
+    return conn
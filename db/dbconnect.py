@@ -1,29 +1,51 @@
+import os
+
 import psycopg2
 
-# Параметры подключения
+# Параметры подключения (можно переопределить переменными окружения DB_NAME, DB_USER и т.д.)
 DB_CONFIG = {
-    'dbname': 'flowers',          # Имя базы данных
-    'user': 'postgres',       # Ваше имя пользователя PostgreSQL
-    'password': ' ',               # Если пароль не установлен, оставьте пустым
-    'host': 'localhost',          # Локальный сервер
-    'port': 5432                  # Стандартный порт PostgreSQL
+    'dbname': os.environ.get('DB_NAME', 'flowers'),          # Имя базы данных
+    'user': os.environ.get('DB_USER', 'postgres'),           # Ваше имя пользователя PostgreSQL
+    'password': os.environ.get('DB_PASSWORD', ' '),          # Если пароль не установлен, оставьте пустым
+    'host': os.environ.get('DB_HOST', 'localhost'),          # Локальный сервер
+    'port': int(os.environ.get('DB_PORT', 5432))             # Стандартный порт PostgreSQL
+}
+
+# Параметры пула соединений (используется ботом)
+DB_POOL_CONFIG = {
+    'minconn': 1,                 # Минимальное количество открытых соединений
+    'maxconn': 10,                # Максимальное количество соединений в пуле
+    'health_check_interval': 30   # Через сколько секунд простоя соединение проверяется запросом SELECT 1
 }
 
-try:
-    # Установление соединения
-    conn = psycopg2.connect(**DB_CONFIG)
-    print("Подключение к базе данных установлено!")
 
-    # Создаем курсор для выполнения SQL-запросов
-    cursor = conn.cursor()
+def check_connection():
+    """Проверяет подключение к базе данных и выводит версию сервера.
+
+    Модуль только описывает параметры подключения и не обращается к БД при импорте;
+    проверка запускается вручную: python db/dbconnect.py
+    """
+    try:
+        # Установление соединения
+        conn = psycopg2.connect(**DB_CONFIG)
+        print("Подключение к базе данных установлено!")
+
+        # Создаем курсор для выполнения SQL-запросов
+        cursor = conn.cursor()
+
+        # Проверим подключение
+        cursor.execute("SELECT version();")
+        print(f"Версия PostgreSQL: {cursor.fetchone()[0]}")
+
+        # Закрываем курсор и соединение
+        cursor.close()
+        conn.close()
+        return True
 
-    # Проверим подключение
-    cursor.execute("SELECT version();")
-    print(f"Версия PostgreSQL: {cursor.fetchone()[0]}")
+    except psycopg2.Error as e:
+        print("Ошибка подключения:", e)
+        return False
 
-    # Закрываем курсор и соединение
-    cursor.close()
-    conn.close()
 
-except psycopg2.Error as e:
-    print("Ошибка подключения:", e)
+if __name__ == "__main__":
+    check_connection()
@@ -0,0 +1,224 @@
+import logging
+
+# Идентификатор advisory-блокировки, чтобы бот и парсер не применяли миграции одновременно
+MIGRATIONS_LOCK_ID = 7355608
+
+# Изменения схемы БД. Примененные шаги записываются в schema_migrations и больше не выполняются;
+# каждый шаг идемпотентен, так как в БД, созданной до появления этой таблицы, он мог быть уже применен.
+MIGRATIONS = [
+    (
+        'products_link_unique',
+        # Уникальный индекс по ссылке нужен для INSERT ... ON CONFLICT (link).
+        # Повторы ссылок, оставшиеся от старого кода, объединяются в строку с наименьшим id,
+        # корзины переводятся на нее (повторы в корзинах объединит cart_user_product_unique).
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'products_link_key') THEN
+                CREATE TEMP TABLE products_duplicates ON COMMIT DROP AS
+                SELECT id, keep_id
+                FROM (SELECT id, min(id) OVER (PARTITION BY link) AS keep_id FROM products) p
+                WHERE id <> keep_id;
+
+                UPDATE cart c SET product_id = d.keep_id
+                FROM products_duplicates d
+                WHERE c.product_id = d.id;
+
+                DELETE FROM products p USING products_duplicates d WHERE p.id = d.id;
+                DROP TABLE products_duplicates;
+
+                CREATE UNIQUE INDEX products_link_key ON products (link);
+            END IF;
+        END
+        $$
+        """
+    ),
+    (
+        'products_category',
+        # Категория каталога, из которой получен товар
+        "ALTER TABLE products ADD COLUMN IF NOT EXISTS category text"
+    ),
+    (
+        'products_change_tracking',
+        # Отпечаток содержимого товара и отметка мягкого удаления
+        """
+        ALTER TABLE products
+            ADD COLUMN IF NOT EXISTS content_hash text,
+            ADD COLUMN IF NOT EXISTS deleted_at timestamptz
+        """
+    ),
+    (
+        'telegram_file_cache',
+        # Соответствие URL изображения и file_id уже отправленного в Telegram фото
+        """
+        CREATE TABLE IF NOT EXISTS telegram_file_cache (
+            image_url text PRIMARY KEY,
+            file_id text NOT NULL,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    ),
+    (
+        'cart_user_product_unique',
+        # Одна строка корзины на пару (пользователь, товар) - нужна для ON CONFLICT.
+        # Дубликаты, оставшиеся от старого кода, объединяются с суммированием количества.
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'cart_user_product_key') THEN
+                UPDATE cart c SET quantity = d.total
+                FROM (
+                    SELECT telegram_user_id, product_id, SUM(quantity) AS total
+                    FROM cart
+                    GROUP BY telegram_user_id, product_id
+                    HAVING COUNT(*) > 1
+                ) d
+                WHERE c.telegram_user_id = d.telegram_user_id AND c.product_id = d.product_id;
+
+                DELETE FROM cart a USING cart b
+                WHERE a.telegram_user_id = b.telegram_user_id
+                  AND a.product_id = b.product_id
+                  AND a.ctid > b.ctid;
+
+                CREATE UNIQUE INDEX cart_user_product_key ON cart (telegram_user_id, product_id);
+            END IF;
+        END
+        $$
+        """
+    ),
+    (
+        'products_numeric_price',
+        # Цена числом и признак "от" (цена начинается от указанной суммы)
+        """
+        ALTER TABLE products
+            ADD COLUMN IF NOT EXISTS price_value numeric(12, 2),
+            ADD COLUMN IF NOT EXISTS price_from boolean NOT NULL DEFAULT false
+        """
+    ),
+    (
+        'products_numeric_price_backfill',
+        # Заполняем числовую цену для строк, загруженных до появления колонки (как normalize_price в парсере)
+        r"""
+        UPDATE products
+        SET price_value = replace(
+                regexp_replace(substring(price FROM '\d[\d\s\u00a0]*(?:[.,]\d+)?'), '[\s\u00a0]', '', 'g'),
+                ',', '.'
+            )::numeric,
+            price_from = lower(btrim(price)) LIKE 'от%'
+        WHERE price_value IS NULL AND price ~ '\d'
+        """
+    ),
+    (
+        'products_search_indexes',
+        # Индексы для поиска: триграммный по названию (для ILIKE '%текст%') и по цене (для диапазонов).
+        # Если расширение pg_trgm недоступно, поиск по названию работает без индекса.
+        """
+        DO $$
+        BEGIN
+            CREATE INDEX IF NOT EXISTS products_price_value_idx ON products (price_value, id);
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS products_name_trgm_idx ON products USING gin (name gin_trgm_ops);
+            EXCEPTION WHEN OTHERS THEN
+                RAISE NOTICE 'Триграммный индекс по products.name не создан: %', SQLERRM;
+            END;
+        END
+        $$
+        """
+    ),
+    (
+        'users_telegram_user_id_unique',
+        # Один пользователь на telegram_user_id - нужно для INSERT ... ON CONFLICT DO NOTHING.
+        # Повторные строки, оставшиеся от старого кода, удаляются (корзины ссылаются на telegram_user_id).
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'users_telegram_user_id_key') THEN
+                DELETE FROM users a USING users b
+                WHERE a.telegram_user_id = b.telegram_user_id
+                  AND a.id > b.id;
+
+                CREATE UNIQUE INDEX users_telegram_user_id_key ON users (telegram_user_id);
+            END IF;
+        END
+        $$
+        """
+    ),
+    (
+        'products_updated_at',
+        # Время последнего изменения товара (включая мягкое удаление): по нему боты
+        # догружают только изменившиеся товары после уведомления об изменении каталога
+        """
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS products_updated_at_idx ON products (updated_at);
+        """
+    ),
+    (
+        'image_files',
+        # Локальные копии изображений: путь изображения на сайте -> SHA-256 файла в хранилище
+        """
+        CREATE TABLE IF NOT EXISTS image_files (
+            image text PRIMARY KEY,
+            sha256 text NOT NULL,
+            fetched_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    ),
+    (
+        'catalog_refresh_runs',
+        # Время начала последнего планового обновления каталога (одно на все экземпляры бота)
+        """
+        CREATE TABLE IF NOT EXISTS catalog_refresh_runs (
+            name text PRIMARY KEY,
+            started_at timestamptz NOT NULL
+        )
+        """
+    ),
+    (
+        'search_queries',
+        # Тексты поисковых запросов, не поместившиеся в callback_data кнопки "Показать еще"
+        """
+        CREATE TABLE IF NOT EXISTS search_queries (
+            key text PRIMARY KEY,
+            query text NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    ),
+]
+
+
+# Были ли миграции уже применены в этом процессе
+_applied = False
+
+
+def apply_migrations(cursor):
+    """Применяет в текущей транзакции миграции схемы, которые еще не применялись к этой БД.
+
+    ALTER TABLE блокирует таблицу целиком, даже если ничего не меняет, поэтому
+    примененные шаги пропускаются, а вызывать функцию нужно в отдельной короткой
+    транзакции, а не в начале долгой загрузки.
+    """
+    global _applied
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK_ID,))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name text PRIMARY KEY,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cursor.execute("SELECT name FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    for name, sql in MIGRATIONS:
+        if name in applied:
+            continue
+        logging.info(f"Применяем миграцию {name}")
+        cursor.execute(sql)
+        cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+    _applied = True
+
+
+def ensure_migrations(cursor):
+    """Применяет миграции один раз за время жизни процесса."""
+    if not _applied:
+        apply_migrations(cursor)
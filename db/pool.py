@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+from db.dbconnect import DB_CONFIG, DB_POOL_CONFIG
+
+# Пул соединений и пул потоков создаются лениво, при первом обращении
+_pool = None
+_executor = None
+_lock = threading.Lock()
+
+# Время последнего использования соединения (по id соединения) для проверки "здоровья"
+_last_used = {}
+
+
+def get_pool():
+    """Возвращает общий пул соединений PostgreSQL, создавая его при первом вызове."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(
+                    DB_POOL_CONFIG['minconn'],
+                    DB_POOL_CONFIG['maxconn'],
+                    **DB_CONFIG
+                )
+                logging.info(
+                    f"Создан пул соединений с БД (min={DB_POOL_CONFIG['minconn']}, "
+                    f"max={DB_POOL_CONFIG['maxconn']})"
+                )
+    return _pool
+
+
+def _get_executor():
+    """Пул потоков для запросов к БД. Его размер совпадает с размером пула соединений,
+    поэтому потокам никогда не приходится ждать свободное соединение."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_POOL_CONFIG['maxconn'],
+                    thread_name_prefix='db'
+                )
+    return _executor
+
+
+def _is_healthy(conn):
+    """Проверяет соединение: закрытые соединения отбрасываются сразу,
+    давно простаивающие проверяются запросом SELECT 1."""
+    if conn.closed:
+        return False
+
+    idle = time.monotonic() - _last_used.get(id(conn), 0)
+    if idle < DB_POOL_CONFIG['health_check_interval']:
+        return True
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        logging.warning(f"Соединение с БД неисправно и будет пересоздано: {e}")
+        return False
+
+
+@contextmanager
+def get_connection():
+    """Выдает соединение из пула и возвращает его обратно после использования.
+
+    При выходе без ошибок транзакция фиксируется, при исключении - откатывается.
+    Если ни одно из maxconn соединений не прошло проверку, выбрасывается OperationalError.
+    """
+    db_pool = get_pool()
+
+    # Неисправные соединения закрываем и берем из пула новые
+    for _ in range(DB_POOL_CONFIG['maxconn']):
+        conn = db_pool.getconn()
+        if _is_healthy(conn):
+            break
+        _last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    else:
+        raise psycopg2.OperationalError(
+            f"Нет исправного соединения с БД: {DB_POOL_CONFIG['maxconn']} соединений не прошли проверку"
+        )
+
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        _last_used[id(conn)] = time.monotonic()
+        db_pool.putconn(conn, close=bool(conn.closed))
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию работы с БД в отдельном потоке,
+    не блокируя цикл событий asyncio."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def close_pool():
+    """Закрывает все соединения пула и останавливает потоки."""
+    global _pool, _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+            logging.info("Пул соединений с БД закрыт")
@@ -0,0 +1,98 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+import config
+
+# Pillow нужен только для уменьшенных копий; без него хранятся только оригиналы
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Качество JPEG уменьшенных копий
+THUMBNAIL_QUALITY = 85
+
+
+class ImageStore:
+    """Локальное хранилище изображений товаров, адресуемое по содержимому.
+
+    Файл называется SHA-256 своего содержимого (objects/ab/abcdef...), поэтому
+    одинаковые изображения разных товаров хранятся один раз, а запись уже
+    существующего файла ничего не делает. Если задан thumbnail_size и установлен
+    Pillow, рядом сохраняется уменьшенная копия в JPEG (thumbs/<размер>/ab/abcdef....jpg)
+    с наибольшей стороной не больше thumbnail_size пикселей.
+    """
+
+    def __init__(self, root: str, thumbnail_size: int = None):
+        self.root = root
+        self.thumbnail_size = thumbnail_size if Image is not None else None
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def thumbnail_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'thumbs', str(self.thumbnail_size), digest[:2], f"{digest}.jpg")
+
+    def has(self, digest: str) -> bool:
+        """Есть ли в хранилище оригинал изображения."""
+        return os.path.exists(self.object_path(digest))
+
+    def path(self, digest: str):
+        """Возвращает путь к файлу для отправки: уменьшенную копию, если она есть,
+        иначе оригинал; None, если изображения нет в хранилище."""
+        if self.thumbnail_size:
+            thumbnail = self.thumbnail_path(digest)
+            if os.path.exists(thumbnail):
+                return thumbnail
+        original = self.object_path(digest)
+        return original if os.path.exists(original) else None
+
+    def put(self, data: bytes) -> str:
+        """Сохраняет изображение (и его уменьшенную копию) и возвращает его SHA-256."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        if self.thumbnail_size and not os.path.exists(self.thumbnail_path(digest)):
+            self._save_thumbnail(digest, data)
+        return digest
+
+    def _save_thumbnail(self, digest, data):
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if image.format == 'JPEG' and max(image.size) <= self.thumbnail_size:
+                    # Изображение и так небольшое - отправляется оригинал
+                    return
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                output = io.BytesIO()
+                image.convert('RGB').save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logging.warning(f"Не удалось уменьшить изображение {digest}: {e}")
+            return
+        self._write(self.thumbnail_path(digest), output.getvalue())
+
+    @staticmethod
+    def _write(path, data):
+        # Запись во временный файл с переименованием: читатели не увидят файл, записанный частично
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def default_store():
+    """Хранилище из настроек (config.IMAGE_DIR) или None, если локальная копия изображений отключена."""
+    if not config.IMAGE_DIR:
+        return None
+    return ImageStore(os.path.join(ROOT_DIR, config.IMAGE_DIR), config.IMAGE_THUMBNAIL_SIZE)
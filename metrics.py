@@ -0,0 +1,96 @@
+# metrics.py
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+import config
+
+# Операции дольше этого времени (сек) записываются в лог как медленные
+SLOW_OPERATION_THRESHOLD = config.SLOW_OPERATION_THRESHOLD
+# Отдельные пороги для видов операций, которые всегда выполняются долго
+SLOW_THRESHOLDS = {
+    'parser': 120.0,
+}
+
+# Границы интервалов гистограммы, сек: от быстрых запросов к БД до этапов парсера
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# kind - вид операции: callback (кнопки), db (запросы к БД), telegram (Bot API), parser (этапы парсера)
+OPERATIONS = Counter(
+    'flowers_operations_total', 'Количество выполненных операций',
+    ['kind', 'name', 'status']
+)
+LATENCY = Histogram(
+    'flowers_operation_duration_seconds', 'Время выполнения операций, сек',
+    ['kind', 'name'], buckets=LATENCY_BUCKETS
+)
+
+_server = None
+
+
+def record(kind: str, name: str, elapsed: float, failed: bool = False):
+    """Учитывает выполненную операцию и пишет в лог, если она выполнялась слишком долго."""
+    OPERATIONS.labels(kind, name, 'error' if failed else 'ok').inc()
+    LATENCY.labels(kind, name).observe(elapsed)
+    if elapsed >= SLOW_THRESHOLDS.get(kind, SLOW_OPERATION_THRESHOLD):
+        logging.warning(f"Медленная операция {kind}/{name}: {elapsed:.3f} с")
+
+
+@contextmanager
+def measure(kind: str, name: str):
+    """Измеряет время выполнения блока кода; исключение учитывается как ошибка."""
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        record(kind, name, time.perf_counter() - started, failed)
+
+
+def timed(kind: str, name: str = None):
+    """Декоратор, измеряющий каждый вызов функции (обычной или асинхронной).
+
+    По умолчанию операция называется по имени функции.
+    """
+    def decorator(func):
+        operation = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with measure(kind, operation):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(kind, operation):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def start_server(port: int, addr: str = '127.0.0.1'):
+    """Запускает HTTP-сервер с метриками в формате Prometheus (http://addr:port/metrics)."""
+    global _server
+    if _server is not None:
+        return
+    try:
+        _server, _ = start_http_server(port, addr=addr)
+        logging.info(f"Метрики доступны по адресу http://{addr}:{port}/metrics")
+    except OSError as e:
+        logging.error(f"Не удалось запустить сервер метрик на порту {port}: {e}")
+
+
+def stop_server():
+    """Останавливает HTTP-сервер с метриками."""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server = None
@@ -0,0 +1,198 @@
+import asyncio
+import random
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+
+# Параметр пагинации каталога (Bitrix) и ограничение на количество страниц
+PAGE_PARAM = 'PAGEN_1'
+MAX_PAGES = 200
+
+# Настройки HTTP-клиента
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/120.0 Safari/537.36'
+}
+HTTP_TIMEOUT = 15
+
+# Ограничения обхода
+CRAWL_CONCURRENCY = 8       # Сколько запросов выполняется одновременно
+HOST_REQUEST_INTERVAL = 0.2 # Минимальный интервал между запросами к одному хосту, сек
+PAGE_PREFETCH = 4           # Сколько страниц одной категории запрашивается одновременно
+MAX_RETRIES = 3             # Количество повторов при ошибках сети и ответах 429/5xx
+BACKOFF_BASE = 1.0          # Базовая задержка перед повтором, сек (удваивается с каждой попыткой)
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def page_url(url, page):
+    """Возвращает адрес страницы каталога с заданным номером."""
+    if page <= 1:
+        return url
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != PAGE_PARAM]
+    query.append((PAGE_PARAM, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def category_from_url(url):
+    """Возвращает имя категории по адресу ее корневой страницы (/catalog/bukety/ -> bukety)."""
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    return segments[-1] if segments else ''
+
+
+def category_from_link(link):
+    """Возвращает имя категории по ссылке на товар (/catalog/bukety/buket-1/ -> bukety) или None."""
+    segments = [segment for segment in urlsplit(link).path.split('/') if segment]
+    return segments[-2] if len(segments) >= 2 else None
+
+
+class HostRateLimiter:
+    """Ограничивает частоту запросов к каждому хосту отдельно."""
+
+    def __init__(self, interval=HOST_REQUEST_INTERVAL):
+        self.interval = interval
+        self._next_time = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def wait(self, host):
+        async with self._locks[host]:
+            loop = asyncio.get_running_loop()
+            delay = self._next_time.get(host, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_time[host] = loop.time() + self.interval
+
+
+class RetryingFetcher:
+    """Загрузка по HTTP с ограничениями параллельности и частоты запросов к хосту
+    и повторами при ошибках сети и ответах 429/5xx (общая для обхода каталога
+    и загрузки изображений).
+
+    Одновременно выполняется не больше concurrency запросов; семафор создается
+    в начале обхода (start), внутри работающего цикла событий.
+    """
+
+    def __init__(self, concurrency, rate_limiter=None, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = None
+
+    def start(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def get(self, client, url):
+        """Выполняет GET-запрос с повторами и возвращает успешный ответ."""
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    await self.rate_limiter.wait(host)
+                    response = await client.get(url)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"Сервер вернул {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+
+            if attempt == self.max_retries:
+                raise error
+            # Экспоненциальная задержка со случайной добавкой, чтобы повторы не шли одновременно
+            delay = self.backoff_base * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+
+class CatalogCrawler(RetryingFetcher):
+    """Параллельно обходит несколько категорий каталога.
+
+    parse_page - функция, которая превращает HTML страницы в список товаров
+    (обычно parse_product_data). Каждый товар помечается категорией.
+    """
+
+    def __init__(self, parse_page, concurrency=CRAWL_CONCURRENCY, rate_limiter=None,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        super().__init__(concurrency, rate_limiter, max_retries, backoff_base)
+        self.parse_page = parse_page
+
+    async def fetch(self, client, url):
+        """Загружает страницу с учетом ограничений параллельности, частоты и повторами при ошибках."""
+        return (await self.get(client, url)).text
+
+    async def crawl_category(self, client, root_url):
+        """Обходит страницы одной категории, пока на них появляются новые товары."""
+        category = category_from_url(root_url)
+        products = []
+        seen_links = set()
+
+        page = 1
+        while page <= MAX_PAGES:
+            # Несколько следующих страниц запрашиваем одновременно, а обрабатываем по порядку
+            pages = range(page, min(page + PAGE_PREFETCH, MAX_PAGES + 1))
+            htmls = await asyncio.gather(*(self.fetch(client, page_url(root_url, n)) for n in pages))
+
+            for html in htmls:
+                # За последней страницей сайт снова отдает уже полученные товары
+                new_products = [
+                    product for product in self.parse_page(html)
+                    if product['link'] not in seen_links
+                ]
+                if not new_products:
+                    return products
+
+                for product in new_products:
+                    product['category'] = category
+                seen_links.update(product['link'] for product in new_products)
+                products.extend(new_products)
+
+            page += len(pages)
+
+        return products
+
+    async def crawl(self, root_urls):
+        """Обходит все категории одновременно.
+
+        Возвращает список товаров (без повторов по ссылке) и список категорий,
+        которые загрузить не удалось.
+        """
+        self.start()
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(headers=HTTP_HEADERS, timeout=HTTP_TIMEOUT,
+                                     follow_redirects=True, limits=limits) as client:
+            results = await asyncio.gather(
+                *(self.crawl_category(client, url) for url in root_urls),
+                return_exceptions=True
+            )
+
+        products = []
+        seen_links = set()
+        failed = []
+        for url, result in zip(root_urls, results):
+            if isinstance(result, Exception):
+                print(f"Не удалось загрузить категорию {url}:", result)
+                failed.append(url)
+                continue
+            if not result:
+                # Категория без единого товара, скорее всего, отдается только через JavaScript
+                print(f"В категории {url} не найдено товаров.")
+                failed.append(url)
+                continue
+            print(f"Категория {category_from_url(url)}: {len(result)} товаров.")
+            # Товар может входить в несколько категорий; оставляем первую
+            for product in result:
+                if product['link'] not in seen_links:
+                    seen_links.add(product['link'])
+                    products.append(product)
+
+        return products, failed
+
+
+def crawl_categories(root_urls, parse_page, **kwargs):
+    """Синхронная обертка над CatalogCrawler.crawl."""
+    return asyncio.run(CatalogCrawler(parse_page, **kwargs).crawl(root_urls))
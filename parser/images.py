@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import psycopg2
+from psycopg2.extras import execute_values
+
+import config
+from db.dbconnect import DB_CONFIG
+from db.migrations import apply_migrations
+from db.catalog_events import notify_catalog_changed, lock_catalog_writes
+from crawler import HTTP_HEADERS, HTTP_TIMEOUT, MAX_RETRIES, BACKOFF_BASE, RetryingFetcher
+
+# Сколько изображений загружается одновременно
+IMAGE_CONCURRENCY = 8
+# Изображения больше этого размера не сохраняются (Telegram не примет такое фото), байт
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+# Значение поля image у товара без изображения
+NO_IMAGE = 'Без изображения'
+
+
+def image_url(image: str) -> str:
+    """Абсолютный адрес изображения по пути из карточки товара (как в боте)."""
+    return config.IMAGE_URL + image.strip('\'"')
+
+
+class ImageMirror(RetryingFetcher):
+    """Параллельно загружает изображения товаров в локальное хранилище.
+
+    Одновременно выполняется не больше concurrency запросов; частота запросов к
+    сайту и повторы при ошибках - те же, что и при обходе каталога (RetryingFetcher).
+    Загруженные файлы сохраняются в хранилище (ImageStore) в отдельном потоке,
+    чтобы хэширование и уменьшение не задерживали остальные загрузки.
+    """
+
+    def __init__(self, store, concurrency=IMAGE_CONCURRENCY, rate_limiter=None,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        super().__init__(concurrency, rate_limiter, max_retries, backoff_base)
+        self.store = store
+
+    async def fetch(self, client, url):
+        """Загружает изображение с повторами при ошибках сети и ответах 429/5xx."""
+        return (await self.get(client, url)).content
+
+    async def download(self, client, image):
+        """Загружает одно изображение и возвращает его SHA-256 в хранилище."""
+        data = await self.fetch(client, image_url(image))
+        if not data:
+            raise ValueError("пустой ответ")
+        if len(data) > MAX_IMAGE_SIZE:
+            raise ValueError(f"слишком большой файл ({len(data)} байт)")
+        return await asyncio.to_thread(self.store.put, data)
+
+    async def mirror(self, images):
+        """Загружает изображения. Возвращает словарь {image: sha256} и список
+        изображений, которые загрузить не удалось."""
+        images = list(images)
+        self.start()
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(headers=HTTP_HEADERS, timeout=HTTP_TIMEOUT,
+                                     follow_redirects=True, limits=limits) as client:
+            results = await asyncio.gather(
+                *(self.download(client, image) for image in images),
+                return_exceptions=True
+            )
+
+        digests = {}
+        failed = []
+        for image, result in zip(images, results):
+            if isinstance(result, Exception):
+                print(f"Не удалось загрузить изображение {image}:", result)
+                failed.append(image)
+            else:
+                digests[image] = result
+        return digests, failed
+
+
+def mirror_images(products, store, **kwargs):
+    """Загружает в локальное хранилище новые и изменившиеся изображения товаров
+    и записывает их SHA-256 в таблицу image_files (боты получают уведомление
+    об изменении каталога и начинают отправлять локальные копии).
+
+    Изображение загружается, если его путь еще не встречался или файла нет в
+    хранилище (путь изображения на сайте меняется вместе с самим изображением).
+    Возвращает сводку {'downloaded', 'failed', 'cached'} или None при ошибке БД.
+    """
+    images = {product['image'] for product in products if product.get('image') not in (None, NO_IMAGE)}
+
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        with conn, conn.cursor() as cursor:
+            apply_migrations(cursor)
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT image, sha256 FROM image_files WHERE image = ANY(%s)", (list(images),))
+            known = dict(cursor.fetchall())
+
+        missing = [image for image in images if image not in known or not store.has(known[image])]
+        digests, failed = asyncio.run(ImageMirror(store, **kwargs).mirror(missing)) if missing else ({}, [])
+
+        if digests:
+            with conn, conn.cursor() as cursor:
+                # fetched_at, как и products.updated_at, берется после блокировки загрузок:
+                # по этим отметкам боты догружают изменения каталога
+                lock_catalog_writes(cursor)
+                execute_values(cursor, """
+                    INSERT INTO image_files (image, sha256, fetched_at) VALUES %s
+                    ON CONFLICT (image) DO UPDATE SET sha256 = EXCLUDED.sha256, fetched_at = EXCLUDED.fetched_at
+                """, list(digests.items()), template="(%s, %s, clock_timestamp())", page_size=1000)
+                notify_catalog_changed(cursor, images=len(digests))
+    except psycopg2.Error as e:
+        print("Ошибка при сохранении изображений в БД:", e)
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+
+    print(
+        f"Изображений загружено: {len(digests)}, с ошибкой: {len(failed)}, "
+        f"уже сохранено ранее: {len(images) - len(missing)}."
+    )
+    return {'downloaded': len(digests), 'failed': len(failed), 'cached': len(images) - len(missing)}
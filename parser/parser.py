@@ -1,35 +1,78 @@
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 import csv
+import hashlib
+import io
+import re
 import psycopg2
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
-print(sys.executable)
+import metrics
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../db')))  # Добавляем путь к db
 from db.dbconnect import DB_CONFIG
+from db.migrations import apply_migrations
+from db.catalog_events import notify_catalog_changed, lock_catalog_writes
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))  # Добавляем путь к модулям парсера
+from crawler import crawl_categories, category_from_url, category_from_link
+from images import mirror_images
+from image_store import default_store
+from catalog_snapshot import fetch_catalog, write_snapshot, snapshot_path
 
 # URL страницы магазина
 URL = config.TARGET_URL  # Замените на URL вашего магазина
 
+# Категории каталога, которые обходит парсер
+CATEGORY_URLS = config.CATEGORY_URLS
+
+# CSV-файл с результатами парсинга (рядом с парсером, независимо от текущего каталога).
+# Перезаписывается при каждом запуске и не хранится в git; данные для тестов - в tests/fixtures
+CSV_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'products.csv')
+
+# Загружать товары в БД пакетно (COPY + INSERT ... ON CONFLICT) вместо построчной загрузки из CSV
+BULK_LOAD = True
+
+# Загружать каталог напрямую по HTTP; Selenium используется только как запасной вариант
+USE_HTTP_FETCHER = True
+
+# Класс карточки товара в каталоге
+PRODUCT_CARD_CLASS = 'col-12 col-sm-6 col-md-6 col-lg-4 col-xl-3 g-mb-35 g-card in-stock'
+
+# Для разбора HTML используем lxml (написан на C), если он установлен
+try:
+    from lxml import etree
+    HTML_PARSER = 'lxml'
+except ImportError:
+    etree = None
+    HTML_PARSER = 'html.parser'
+
+# Размер части страницы, которая передается потоковому разбору за раз, символов
+PARSE_CHUNK_SIZE = 64 * 1024
+# Текст этих элементов не входит в текст карточки (как в get_text BeautifulSoup)
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
 # Путь к вашему драйверу Chrome
 CHROME_DRIVER_PATH = r"D:\chromedriver\chromedriver-win64\chromedriver.exe"
 # Убедитесь, что путь к chromedriver указан правильно
 
-# Настройки для Selenium
-chrome_options = Options()
-#chrome_options.add_argument("--headless")  # Запуск в фоновом режиме, без открытия браузера
 
 # Функция для получения данных через Selenium
 def get_page_with_selenium(url):
+    # Selenium и Chrome нужны только для запасного варианта, поэтому импортируем их здесь
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Настройки для Selenium
+    chrome_options = Options()
+    #chrome_options.add_argument("--headless")  # Запуск в фоновом режиме, без открытия браузера
+
     driver = webdriver.Chrome(service=Service(CHROME_DRIVER_PATH), options=chrome_options)
     driver.get(url)
 
@@ -65,44 +108,170 @@ def get_page_with_selenium(url):
 
 
 # Функция для парсинга данных о товарах
+@metrics.timed('parser', 'parse')
 def parse_product_data(page_html):
     """Парсит данные товаров из HTML страницы"""
-    soup = BeautifulSoup(page_html, 'html.parser')
-    products = []
+    return list(iter_product_data(page_html))
 
-    # Найдем все элементы с товарами
-    product_items = soup.find_all('div', class_='col-12 col-sm-6 col-md-6 col-lg-4 col-xl-3 g-mb-35 g-card in-stock')
 
-    for item in product_items:
-        # Извлекаем название товара
-        name_tag = item.find('div', class_='h3')
-        name = name_tag.get_text(strip=True) if name_tag else 'Без названия'
+def iter_product_data(page_html):
+    """Парсит данные товаров из HTML страницы и отдает их по одному (генератор).
 
-        # Извлекаем ссылку на товар
-        link_tag = item.find('a', href=True)
-        link = link_tag['href'] if link_tag else 'Без ссылки'
+    page_html - строка или итерируемое частей страницы (например, по мере загрузки).
+    С lxml страница разбирается потоково: товар отдается, как только разобрана
+    его карточка, а разобранные карточки удаляются из дерева. Без lxml страница
+    разбирается целиком через BeautifulSoup.
+    """
+    chunks = [page_html] if isinstance(page_html, str) else page_html
+    if HTML_PARSER != 'lxml':
+        # В дерево попадают только карточки товаров, остальная разметка страницы пропускается
+        soup = BeautifulSoup(
+            ''.join(chunks), HTML_PARSER,
+            parse_only=SoupStrainer('div', class_=PRODUCT_CARD_CLASS)
+        )
+        for item in soup.find_all('div', class_=PRODUCT_CARD_CLASS):
+            yield extract_product(item)
+        return
 
-        # Извлекаем цену товара
-        price_tag = item.find('div', class_='price g-div')
-        price = price_tag.get_text(strip=True) if price_tag else 'Без цены'
+    pull_parser = etree.HTMLPullParser(events=('end',), tag='div')
+    for chunk in chunks:
+        for start in range(0, len(chunk), PARSE_CHUNK_SIZE):
+            pull_parser.feed(chunk[start:start + PARSE_CHUNK_SIZE])
+            yield from _read_product_cards(pull_parser)
+    pull_parser.close()
+    yield from _read_product_cards(pull_parser)
 
-        # Извлекаем изображение товара
-        img_tag = item.find('div', class_='product')
-        image = img_tag['style'].split('url(')[1].split(')')[0] if img_tag and 'url(' in img_tag[
-            'style'] else 'Без изображения'
 
-        # Добавляем товар в список
-        products.append({
-            'name': name,
-            'link': link,
-            'price': price,
-            'image': image
-        })
+def _read_product_cards(pull_parser):
+    """Отдает товары из карточек, разбор которых закончился."""
+    for _, element in pull_parser.read_events():
+        if not _has_class_value(element.get('class'), PRODUCT_CARD_CLASS):
+            continue
+        yield extract_product_element(element)
+        # Карточка больше не нужна: освобождаем ее и предыдущие элементы того же уровня
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _has_class_value(value, class_name):
+    """Проверяет значение атрибута class так же, как find(..., class_=...) в BeautifulSoup."""
+    classes = value.split() if value else []
+    return class_name in classes or ' '.join(classes) == class_name
+
+
+def _element_text(element, strings=None):
+    """Текст элемента lxml, как get_text(strip=True) в BeautifulSoup (без комментариев и скриптов)."""
+    top = strings is None
+    if top:
+        strings = []
+    if isinstance(element.tag, str) and element.tag not in NON_TEXT_TAGS:
+        if element.text:
+            strings.append(element.text)
+        for child in element:
+            _element_text(child, strings)
+            if child.tail:
+                strings.append(child.tail)
+    if top:
+        return ''.join(string.strip() for string in strings)
+
+
+def extract_product_element(item):
+    """Извлекает данные товара из карточки, разобранной lxml (как extract_product)."""
+    name_tag = link_tag = price_tag = img_tag = None
+
+    for tag in item.iterdescendants():
+        if tag.tag == 'div':
+            classes = tag.get('class')
+            if name_tag is None and _has_class_value(classes, 'h3'):
+                name_tag = tag
+            if price_tag is None and _has_class_value(classes, 'price g-div'):
+                price_tag = tag
+            if img_tag is None and _has_class_value(classes, 'product'):
+                img_tag = tag
+        elif tag.tag == 'a' and link_tag is None and tag.get('href') is not None:
+            link_tag = tag
+
+        if name_tag is not None and link_tag is not None and price_tag is not None and img_tag is not None:
+            break
+
+    style = img_tag.attrib['style'] if img_tag is not None else ''
+    return {
+        'name': _element_text(name_tag) if name_tag is not None else 'Без названия',
+        'link': link_tag.get('href') if link_tag is not None else 'Без ссылки',
+        'price': _element_text(price_tag) if price_tag is not None else 'Без цены',
+        'image': style.split('url(')[1].split(')')[0] if 'url(' in style else 'Без изображения',
+    }
+
+
+def _has_class(tag, class_name):
+    """Проверяет класс так же, как find(..., class_=...) в BeautifulSoup."""
+    classes = tag.get('class')
+    if not classes:
+        return False
+    return class_name in classes or ' '.join(classes) == class_name
+
+
+def extract_product(item):
+    """Извлекает данные товара из карточки за один проход по ее элементам."""
+    name_tag = link_tag = price_tag = img_tag = None
+
+    for tag in item.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        if tag.name == 'div':
+            if name_tag is None and _has_class(tag, 'h3'):
+                name_tag = tag
+            if price_tag is None and _has_class(tag, 'price g-div'):
+                price_tag = tag
+            if img_tag is None and _has_class(tag, 'product'):
+                img_tag = tag
+        elif tag.name == 'a' and link_tag is None and tag.get('href') is not None:
+            link_tag = tag
+
+        if name_tag is not None and link_tag is not None and price_tag is not None and img_tag is not None:
+            break
+
+    # Извлекаем название товара
+    name = name_tag.get_text(strip=True) if name_tag else 'Без названия'
+
+    # Извлекаем ссылку на товар
+    link = link_tag['href'] if link_tag else 'Без ссылки'
+
+    # Извлекаем цену товара
+    price = price_tag.get_text(strip=True) if price_tag else 'Без цены'
+
+    # Извлекаем изображение товара
+    image = img_tag['style'].split('url(')[1].split(')')[0] if img_tag and 'url(' in img_tag[
+        'style'] else 'Без изображения'
+
+    return {
+        'name': name,
+        'link': link,
+        'price': price,
+        'image': image
+    }
+
+# Число в строке цены: допускаются пробелы между разрядами и дробная часть через точку или запятую
+PRICE_NUMBER_RE = re.compile(r'\d[\d\s\u00a0]*(?:[.,]\d+)?')
+
+
+def normalize_price(price_str):
+    """Разбирает строку цены в число и признак "от" ('от 1 550 ₽' -> (1550.0, True)).
+
+    Если числа в строке нет (например, 'Без цены'), возвращает (None, False).
+    """
+    match = PRICE_NUMBER_RE.search(price_str or '')
+    if match is None:
+        return None, False
+    value = float(re.sub(r'[\s\u00a0]', '', match.group()).replace(',', '.'))
+    return value, price_str.strip().lower().startswith('от')
 
-    return products
 
 # Функция для сохранения данных в CSV
-def save_to_csv(data, filename='products.csv'):
+def save_to_csv(data, filename=CSV_FILENAME):
     """Сохраняем данные в CSV файл"""
     if data:
         keys = data[0].keys()  # Заголовки для CSV файла
@@ -115,62 +284,380 @@ def save_to_csv(data, filename='products.csv'):
 
 
 # Функция для загрузки данных в базу данных PostgreSQL
-def load_data_to_db(csv_filename='products.csv'):
+def load_data_to_db(csv_filename=CSV_FILENAME):
     """Загружает данные из CSV в базу данных PostgreSQL"""
+    conn = None
     try:
         # Подключаемся к базе данных с использованием DB_CONFIG
         conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        # Открываем CSV и загружаем данные в базу
-        with open(csv_filename, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Проверяем, существует ли товар с таким же link
-                cursor.execute("SELECT 1 FROM products WHERE link = %s LIMIT 1", (row['link'],))
-                if cursor.fetchone() is None:
-                    # Если товар с таким link не найден, вставляем его в базу
-                    cursor.execute(
-                        "INSERT INTO products (name, link, price, image) VALUES (%s, %s, %s, %s)",
-                        (row['name'], row['link'], row['price'], row['image'])
-                    )
-                else:
-                    # Если товар уже существует, можно обновить его данные
-                    cursor.execute(
-                        """
-                        UPDATE products
-                        SET name = %s, price = %s, image = %s
-                        WHERE link = %s
-                        """,
-                        (row['name'], row['price'], row['image'], row['link'])
-                    )
-
-        conn.commit()
+        # Миграции - отдельной короткой транзакцией, чтобы не держать блокировки таблиц всю загрузку
+        with conn, conn.cursor() as cursor:
+            apply_migrations(cursor)
+
+        with conn, conn.cursor() as cursor:
+            lock_catalog_writes(cursor)
+            rows_loaded = 0
+
+            # Открываем CSV и загружаем данные в базу
+            with open(csv_filename, mode='r', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    # Проверяем, существует ли товар с таким же link
+                    cursor.execute("SELECT 1 FROM products WHERE link = %s LIMIT 1", (row['link'],))
+                    price_value, price_from = normalize_price(row['price'])
+                    # Поля отслеживания изменений заполняются так же, как в load_products_bulk:
+                    # updated_at - после блокировки загрузок, иначе боты могут пропустить эти строки
+                    values = {
+                        'name': row['name'], 'link': row['link'], 'price': row['price'], 'image': row['image'],
+                        'content_hash': product_fingerprint(row),
+                        'price_value': price_value, 'price_from': price_from,
+                    }
+                    if cursor.fetchone() is None:
+                        # Если товар с таким link не найден, вставляем его в базу
+                        cursor.execute(
+                            """
+                            INSERT INTO products (name, link, price, image, content_hash, price_value, price_from,
+                                                  deleted_at, updated_at)
+                            VALUES (%(name)s, %(link)s, %(price)s, %(image)s, %(content_hash)s, %(price_value)s,
+                                    %(price_from)s, NULL, clock_timestamp())
+                            """,
+                            values
+                        )
+                    else:
+                        # Если товар уже существует, можно обновить его данные
+                        cursor.execute(
+                            """
+                            UPDATE products
+                            SET name = %(name)s, price = %(price)s, image = %(image)s,
+                                content_hash = %(content_hash)s, deleted_at = NULL,
+                                price_value = %(price_value)s, price_from = %(price_from)s,
+                                updated_at = clock_timestamp()
+                            WHERE link = %(link)s
+                            """,
+                            values
+                        )
+                    rows_loaded += 1
+
+            # Боты получат уведомление после фиксации транзакции
+            notify_catalog_changed(cursor, loaded=rows_loaded)
         print(f"Данные из {csv_filename} успешно загружены в базу данных!")
+        return True
+
+    except psycopg2.Error as e:
+        print("Ошибка при загрузке данных в БД:", e)
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+class ProductsCsvStream:
+    """Файлоподобный объект для COPY: отдает товары построчно в формате CSV,
+    не собирая весь файл в памяти."""
+
+    FIELDS = ('name', 'link', 'price', 'image', 'category', 'content_hash', 'price_value', 'price_from')
+
+    def __init__(self, products):
+        self._rows = iter(products)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = b''
+
+    def read(self, size=-1):
+        # Дописываем строки, пока не наберется нужный объем или товары не закончатся
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow([row.get(field) for field in self.FIELDS])
+            self._pending += self._buffer.getvalue().encode('utf-8')
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+
+def product_fingerprint(product):
+    """Отпечаток товара: хеш названия, цены и изображения."""
+    data = '\x1f'.join((product['name'], product['price'], product['image']))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def product_category(link, category):
+    """Категория товара для сравнения загрузок.
+
+    У товаров без категории (загруженных до ее появления или из CSV) она
+    определяется по ссылке, чтобы такие товары считались исчезнувшими, только
+    если их категория действительно обойдена.
+    """
+    return category if category is not None else category_from_link(link)
+
+
+class ProductsDiff:
+    """Сравнивает свежие товары с уже сохраненными в БД по мере их поступления.
+
+    existing - словарь {link: (content_hash, deleted, category, image)} из таблицы products.
+    add(product) вызывается для каждого товара и возвращает строку для записи в БД
+    (или None, если товар не изменился); result() после последнего товара
+    возвращает сводку. Исчезнувшими считаются только товары из обойденных
+    категорий, чтобы сбой загрузки одной категории не удалял товары другой.
+    """
+
+    def __init__(self, existing):
+        self.existing = existing
+        self.diff = {'new': [], 'changed': [], 'unchanged': 0, 'vanished': [], 'old_images': []}
+        self.categories = set()
+        # link -> как товар учтен в сводке ('new', 'changed' или 'unchanged')
+        self._seen = {}
+
+    def add(self, product):
+        link = product['link']
+        self.categories.add(product_category(link, product.get('category')))
+        content_hash = product_fingerprint(product)
+        # Цена нормализуется при загрузке: число и признак "от"
+        price_value, price_from = normalize_price(product['price'])
+        row = dict(product, content_hash=content_hash, price_value=price_value, price_from=price_from)
+
+        seen = self._seen.get(link)
+        if seen is not None:
+            # При повторяющихся ссылках побеждает последняя строка, как и при построчной загрузке:
+            # повтор всегда записывается, а из записанных строк берется последняя
+            if seen == 'unchanged':
+                self.diff['unchanged'] -= 1
+                self.diff['changed'].append(row)
+                self._seen[link] = 'changed'
+            return row
+
+        if link not in self.existing:
+            kind = 'new'
+        elif self.existing[link][:2] != (content_hash, False):
+            # Изменившийся или снова появившийся товар
+            kind = 'changed'
+            old_image = self.existing[link][3]
+            if old_image is not None and old_image != product['image']:
+                self.diff['old_images'].append(old_image)
+        else:
+            kind = 'unchanged'
+        self._seen[link] = kind
+        if kind == 'unchanged':
+            self.diff['unchanged'] += 1
+            return None
+        self.diff[kind].append(row)
+        return row
+
+    def result(self):
+        for link, (content_hash, deleted, category, image) in self.existing.items():
+            if not deleted and link not in self._seen and product_category(link, category) in self.categories:
+                self.diff['vanished'].append(link)
+        return self.diff
+
+
+def diff_products(products, existing):
+    """Сравнивает свежие товары с уже сохраненными в БД (см. ProductsDiff)."""
+    diff = ProductsDiff(existing)
+    for product in products:
+        diff.add(product)
+    return diff.result()
+
+
+def load_products_bulk(products):
+    """Загружает в PostgreSQL только новые и изменившиеся товары одной транзакцией
+    (COPY во временную таблицу и единственный INSERT ... ON CONFLICT (link) DO UPDATE),
+    а исчезнувшие с сайта товары помечает удаленными.
+
+    Товары читаются один раз и передаются в COPY по мере поступления, поэтому
+    products может быть генератором (например, iter_product_data).
+    Возвращает сводку изменений (см. ProductsDiff) или None при ошибке.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        # Миграции - отдельной короткой транзакцией: ALTER TABLE блокирует чтение товаров
+        # ботами, и держать такую блокировку всю загрузку нельзя
+        with conn, conn.cursor() as cursor:
+            apply_migrations(cursor)
+
+        with conn, conn.cursor() as cursor:
+            lock_catalog_writes(cursor)
+
+            # Отпечатки уже сохраненных товаров
+            cursor.execute("SELECT link, content_hash, deleted_at IS NOT NULL, category, image FROM products")
+            existing = {link: (content_hash, deleted, category, image)
+                        for link, content_hash, deleted, category, image in cursor.fetchall()}
+            products_diff = ProductsDiff(existing)
+
+            # Временная таблица удаляется автоматически при фиксации транзакции;
+            # seq - порядок поступления строк (из повторов одной ссылки берется последняя)
+            cursor.execute("""
+                CREATE TEMP TABLE products_staging (
+                    seq bigint GENERATED ALWAYS AS IDENTITY,
+                    name text,
+                    link text,
+                    price text,
+                    image text,
+                    category text,
+                    content_hash text,
+                    price_value numeric(12, 2),
+                    price_from boolean
+                ) ON COMMIT DROP
+            """)
+            # Товары сравниваются с БД и попадают в COPY по мере чтения
+            upserts = (row for row in map(products_diff.add, products) if row is not None)
+            cursor.copy_expert(
+                "COPY products_staging (name, link, price, image, category, content_hash, price_value, price_from) "
+                "FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8')",
+                ProductsCsvStream(upserts)
+            )
+            diff = products_diff.result()
+            upserts = diff['new'] + diff['changed']
+            if upserts:
+                # updated_at берется после блокировки загрузок (lock_catalog_writes):
+                # у следующей загрузки время всегда будет больше
+                cursor.execute("""
+                    INSERT INTO products (name, link, price, image, category, content_hash, price_value, price_from,
+                                          updated_at)
+                    SELECT DISTINCT ON (link) name, link, price, image, category, content_hash, price_value,
+                           price_from, clock_timestamp()
+                    FROM products_staging
+                    ORDER BY link, seq DESC
+                    ON CONFLICT (link) DO UPDATE
+                    SET name = EXCLUDED.name, price = EXCLUDED.price, image = EXCLUDED.image,
+                        category = COALESCE(EXCLUDED.category, products.category),
+                        content_hash = EXCLUDED.content_hash, deleted_at = NULL,
+                        price_value = EXCLUDED.price_value, price_from = EXCLUDED.price_from,
+                        updated_at = EXCLUDED.updated_at
+                """)
+
+            if diff['old_images']:
+                # Бот больше не должен отправлять старые фото по сохраненным file_id
+                cursor.execute(
+                    "DELETE FROM telegram_file_cache WHERE image_url = ANY(%s)",
+                    ([config.IMAGE_URL + image for image in diff['old_images']],)
+                )
+
+            if diff['vanished']:
+                # Мягкое удаление: строка остается, чтобы не ломать корзины пользователей
+                cursor.execute(
+                    "UPDATE products SET deleted_at = now(), updated_at = clock_timestamp() WHERE link = ANY(%s)",
+                    (diff['vanished'],)
+                )
+
+            if upserts or diff['vanished']:
+                # Боты получат уведомление после фиксации транзакции и догрузят изменения
+                notify_catalog_changed(
+                    cursor, new=len(diff['new']), changed=len(diff['changed']), deleted=len(diff['vanished'])
+                )
+
+        print(
+            f"Новых товаров: {len(diff['new'])}, изменено: {len(diff['changed'])}, "
+            f"без изменений: {diff['unchanged']}, удалено: {len(diff['vanished'])}."
+        )
+        return diff
 
     except psycopg2.Error as e:
         print("Ошибка при загрузке данных в БД:", e)
+        return None
     finally:
-        cursor.close()
-        conn.close()
+        if conn is not None:
+            conn.close()
+
+
+def write_catalog_snapshot(path):
+    """Записывает снимок каталога (catalog_snapshot.py) по данным из БД, чтобы бот
+    запускался без запроса к БД и работал при ее недоступности. Возвращает True при успехе."""
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        with conn, conn.cursor() as cursor:
+            rows, version = fetch_catalog(cursor)
+        write_snapshot(path, rows, version)
+    except (psycopg2.Error, OSError) as e:
+        print("Ошибка при записи снимка каталога:", e)
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+    print(f"Снимок каталога ({len(rows)} товаров) сохранен в {path}")
+    return True
+
+
+def get_products(urls):
+    """Получает товары всех категорий: параллельно по HTTP,
+    а категории, которые не удалось загрузить, - через Selenium."""
+    products = []
+    failed = list(urls)
 
-def main():
-    # Получаем страницу через Selenium
-    page_html = get_page_with_selenium(URL)
-    if page_html:
+    if USE_HTTP_FETCHER:
+        products, failed = crawl_categories(urls, parse_product_data)
+
+    seen_links = {product['link'] for product in products}
+    for url in failed:
+        print(f"Загружаем категорию {url} через Selenium.")
+        # Получаем страницу через Selenium
+        page_html = get_page_with_selenium(url)
+        if not page_html:
+            continue
         # Парсим данные товаров
-        products = parse_product_data(page_html)
-        if products:
-            # Сохраняем данные в CSV
-            save_to_csv(products)
-            print(f'Данные о {len(products)} товарах сохранены в файл products.csv')
-
-            # Загружаем данные в базу данных
-            load_data_to_db()
+        for product in parse_product_data(page_html):
+            if product['link'] not in seen_links:
+                seen_links.add(product['link'])
+                product['category'] = category_from_url(url)
+                products.append(product)
+
+    return products
+
+
+def main(progress=None):
+    """Запускает полный цикл парсинга. Возвращает True, если товары загружены в БД.
+
+    progress - необязательная функция, которой сообщается текущий этап
+    ('fetch', 'save', 'images', 'load'); ее использует бот для отображения хода обновления.
+    """
+    if progress is None:
+        progress = lambda stage: None
+
+    # Длительность этапов попадает в метрики (при запуске из бота - на его сервер метрик)
+    progress('fetch')
+    with metrics.measure('parser', 'fetch'):
+        products = get_products(CATEGORY_URLS)
+    if not products:
+        print("Не удалось найти товары на странице.")
+        return False
+
+    # Сохраняем данные в CSV
+    progress('save')
+    with metrics.measure('parser', 'csv'):
+        save_to_csv(products)
+    print(f'Данные о {len(products)} товарах сохранены в файл products.csv')
+
+    # Изображения сохраняются до загрузки товаров в БД, чтобы боты, получив
+    # уведомление об изменении каталога, сразу видели их локальные копии.
+    # Ошибки загрузки изображений не прерывают обновление: бот отправит их по URL
+    store = default_store()
+    if store is not None:
+        progress('images')
+        with metrics.measure('parser', 'images'):
+            mirror_images(products, store)
+
+    # Загружаем данные в базу данных
+    progress('load')
+    with metrics.measure('parser', 'load'):
+        if BULK_LOAD:
+            loaded = load_products_bulk(products) is not None
         else:
-            print("Не удалось найти товары на странице.")
-    else:
-        print("Не удалось загрузить страницу.")
+            loaded = load_data_to_db()
+
+    # Снимок каталога пишется после фиксации загрузки, поэтому совпадает с БД на момент своей версии.
+    # Ошибка записи снимка не отменяет обновление: бот загрузит каталог из БД
+    path = snapshot_path()
+    if loaded and path is not None:
+        with metrics.measure('parser', 'snapshot'):
+            write_catalog_snapshot(path)
+    return loaded
 
 if __name__ == "__main__":
     main()
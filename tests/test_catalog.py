@@ -0,0 +1,89 @@
+"""Листание каталога бота по ключу (bot.catalog.Catalog.page_at).
+
+Страница строится относительно товара на краю предыдущей страницы, поэтому после
+обновления каталога (Catalog.updated) товары не пропускаются и не повторяются.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd  # noqa: E402
+
+from bot.catalog import Catalog, COLUMNS, ORDERS  # noqa: E402
+
+PER_PAGE = 3
+
+
+def make_products(ids, name=lambda product_id: f"Букет {product_id % 4}", price=lambda product_id: product_id % 3 * 100):
+    return pd.DataFrame([{
+        'id': product_id,
+        'name': name(product_id),
+        'link': f"/catalog/bukety/{product_id}/",
+        'price': f"{price(product_id)} ₽",
+        'image': '',
+        'price_value': float(price(product_id)),
+        'price_from': False,
+        'image_hash': None,
+    } for product_id in ids], columns=COLUMNS)
+
+
+def page_after(catalog, order, product, direction='>'):
+    return catalog.page_at(order, direction, catalog.cursor_key(order, product), product['id'], PER_PAGE)
+
+
+def browse(catalog, order):
+    """Все товары каталога, пролистанные по ключу с первой страницы."""
+    products = catalog.slice(order, 0, PER_PAGE)
+    seen = list(products)
+    while products:
+        _, products = page_after(catalog, order, products[-1])
+        seen.extend(products)
+    return [product['id'] for product in seen]
+
+
+class CatalogPageAtTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = Catalog(make_products(range(1, 15)))
+
+    def test_browsing_matches_order(self):
+        for order in ORDERS:
+            with self.subTest(order=order):
+                expected = [product['id'] for product in self.catalog.slice(order, 0, len(self.catalog))]
+                self.assertEqual(browse(self.catalog, order), expected)
+
+    def test_previous_page(self):
+        for order in ORDERS:
+            with self.subTest(order=order):
+                second = self.catalog.page(order, 1, PER_PAGE)
+                start, products = page_after(self.catalog, order, second[0], direction='<')
+                self.assertEqual(start, 0)
+                self.assertEqual(products, self.catalog.page(order, 0, PER_PAGE))
+
+    def test_catalog_swap_keeps_position(self):
+        for order in ORDERS:
+            with self.subTest(order=order):
+                first = self.catalog.page(order, 0, PER_PAGE)
+                # Пока пользователь смотрел страницу, товары с нее удалены, в том числе товар ключа
+                updated = self.catalog.updated(make_products([]), [first[0]['id'], first[-1]['id']], version=None)
+
+                start, products = page_after(updated, order, first[-1])
+                self.assertEqual(start, PER_PAGE - 2)
+                self.assertEqual(products, self.catalog.page(order, 1, PER_PAGE))
+
+    def test_truncated_name_key(self):
+        catalog = Catalog(make_products(range(1, 10), name=lambda product_id: f"Букет {product_id}: розы"))
+        product = catalog.page('name_asc', 0, PER_PAGE)[-1]
+        # Товара уже нет, в кнопке было только начало названия
+        updated = catalog.updated(make_products([]), [product['id']], version=None)
+        _, products = updated.page_at('name_asc', '>', 'Букет 3', product['id'], PER_PAGE)
+        self.assertEqual([product['id'] for product in products], [4, 5, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Соответствие извлечения товаров (parser.parse_product_data) прежнему парсеру.
+
+Карточки товаров строятся из tests/fixtures (товары, собранные с сайта: products.csv -
+одна страница, catalog.csv - весь каталог) в разметке страницы каталога. Результат должен совпадать и со строками CSV, и
+с результатом прежнего парсера (find по каждой карточке, html.parser).
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import html
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+# Неизменяемые данные для тестов (парсер при запуске перезаписывает свой CSV, а не эти файлы)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PRODUCTS_FIXTURE = os.path.join(FIXTURES_DIR, 'products.csv')
+CATALOG_FIXTURE = os.path.join(FIXTURES_DIR, 'catalog.csv')
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from parser import parser  # noqa: E402
+
+FIELDS = ['name', 'link', 'price', 'image']
+
+
+def load_fixture_products(filename=PRODUCTS_FIXTURE):
+    with open(filename, encoding='utf-8', newline='') as file:
+        return [{field: row[field] for field in FIELDS} for row in csv.DictReader(file)]
+
+
+def render_card(product, with_image=True, with_price=True):
+    """Карточка товара в разметке сайта (текст экранируется, как в HTML страницы)."""
+    image = (f'<div class="product" style="background-image: url({html.escape(product["image"])})"></div>'
+             if with_image else '<div class="product" style="background-color: #fff"></div>')
+    price = f'<div class="price g-div"> {html.escape(product["price"])} </div>' if with_price else ''
+    return f"""
+<div class="{parser.PRODUCT_CARD_CLASS}">
+  <div class="g-card-inner">
+    <a href="{html.escape(product['link'])}" class="g-card-link">{image}</a>
+    <div class="g-card-body">
+      <div class="h3">
+        {html.escape(product['name'])}
+      </div>
+      <div class="price-old">0 ₽</div>
+      {price}
+    </div>
+  </div>
+</div>"""
+
+
+def render_page(cards):
+    return f"""<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"></head>
+<body>
+<nav><a href="/catalog/">Каталог</a><div class="h3">Меню</div></nav>
+<div class="row">{''.join(cards)}</div>
+<div class="col-12 g-card">не товар</div>
+</body></html>"""
+
+
+def reference_parse(page_html):
+    """Прежний парсер: поиск элементов в каждой карточке через find."""
+    soup = BeautifulSoup(page_html, 'html.parser')
+    products = []
+    for item in soup.find_all('div', class_=parser.PRODUCT_CARD_CLASS):
+        name_tag = item.find('div', class_='h3')
+        link_tag = item.find('a', href=True)
+        price_tag = item.find('div', class_='price g-div')
+        img_tag = item.find('div', class_='product')
+        products.append({
+            'name': name_tag.get_text(strip=True) if name_tag else 'Без названия',
+            'link': link_tag['href'] if link_tag else 'Без ссылки',
+            'price': price_tag.get_text(strip=True) if price_tag else 'Без цены',
+            'image': img_tag['style'].split('url(')[1].split(')')[0]
+            if img_tag and 'url(' in img_tag['style'] else 'Без изображения',
+        })
+    return products
+
+
+class ParseProductDataTest(unittest.TestCase):
+
+    def test_matches_fixture_csv(self):
+        products = load_fixture_products()
+        self.assertTrue(products)
+        page_html = render_page(render_card(product) for product in products)
+
+        parsed = parser.parse_product_data(page_html)
+        self.assertEqual(parsed, products)
+        self.assertEqual(parsed, reference_parse(page_html))
+
+    def test_matches_full_catalog_fixture(self):
+        products = load_fixture_products(CATALOG_FIXTURE)
+        self.assertGreater(len(products), len(load_fixture_products()))
+        page_html = render_page(render_card(product) for product in products)
+
+        parsed = parser.parse_product_data(page_html)
+        self.assertEqual(parsed, products)
+        self.assertEqual(parsed, reference_parse(page_html))
+
+    def test_missing_fields_match_reference(self):
+        product = load_fixture_products()[0]
+        page_html = render_page([
+            render_card(product, with_image=False),
+            render_card(product, with_price=False),
+        ])
+
+        parsed = parser.parse_product_data(page_html)
+        self.assertEqual(parsed, reference_parse(page_html))
+        self.assertEqual(parsed[0]['image'], 'Без изображения')
+        self.assertEqual(parsed[1]['price'], 'Без цены')
+
+    @unittest.skipIf(parser.etree is None, "потоковый разбор работает только с lxml")
+    def test_first_product_before_page_is_parsed(self):
+        products = load_fixture_products()
+        page_html = render_page(render_card(product) for product in products)
+        chunk_size = 512
+        total_chunks = -(-len(page_html) // chunk_size)
+        fed = []
+
+        def chunks():
+            for start in range(0, len(page_html), chunk_size):
+                fed.append(start)
+                yield page_html[start:start + chunk_size]
+
+        stream = parser.iter_product_data(chunks())
+        first = next(stream)
+        self.assertEqual(first, products[0])
+        # Первый товар получен, когда большая часть страницы еще не передана разбору
+        self.assertLess(len(fed), total_chunks // 2)
+        self.assertEqual([first, *stream], products)
+        self.assertEqual(len(fed), total_chunks)
+
+    def test_html_parser_fallback_matches(self):
+        page_html = render_page(render_card(product) for product in load_fixture_products())
+        html_parser = parser.HTML_PARSER
+        try:
+            parser.HTML_PARSER = 'html.parser'
+            parsed = parser.parse_product_data(page_html)
+        finally:
+            parser.HTML_PARSER = html_parser
+        self.assertEqual(parsed, reference_parse(page_html))
+
+
+class DiffProductsTest(unittest.TestCase):
+
+    @staticmethod
+    def stored(product, category=None, deleted=False):
+        return (parser.product_fingerprint(product), deleted, category, product['image'])
+
+    def test_category_less_products(self):
+        products = load_fixture_products()
+        kept, missing = products[0], products[1]
+        # Товар другой категории, сохраненный без категории
+        other = dict(products[2], link='/catalog/rozy/roza-1/')
+        existing = {
+            kept['link']: self.stored(kept),
+            missing['link']: self.stored(missing),
+            other['link']: self.stored(other),
+        }
+
+        # Свежий товар тоже без категории
+        diff = parser.diff_products([kept], existing)
+        self.assertEqual(diff['unchanged'], 1)
+        self.assertEqual(diff['new'] + diff['changed'], [])
+        # Исчезнувшим считается только товар обойденной категории (bukety)
+        self.assertEqual(diff['vanished'], [missing['link']])
+
+    def test_category_less_row_of_crawled_category(self):
+        product = load_fixture_products()[0]
+        existing = {product['link']: self.stored(product)}
+
+        diff = parser.diff_products([dict(product, category='bukety')], existing)
+        self.assertEqual(diff['unchanged'], 1)
+        self.assertEqual(diff['vanished'], [])
+
+        # Уже удаленный товар не удаляется повторно
+        existing = {product['link']: self.stored(product, deleted=True)}
+        other = dict(product, link='/catalog/bukety/other/', category='bukety')
+        self.assertEqual(parser.diff_products([other], existing)['vanished'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()